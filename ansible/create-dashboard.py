@@ -1,207 +1,201 @@
 #!/usr/bin/env python3
 """
 CERBERUS - Zabbix Dashboard Creator
-Automatically creates a monitoring dashboard with CPU/RAM graphs
+Builds the monitoring dashboard for every monitored host in the inventory and
+updates it in place on later runs
 """
-import requests
+import argparse
+import hashlib
 import json
+import os
 import sys
-
-ZABBIX_URL = "http://localhost/api_jsonrpc.php"
-ZABBIX_USER = "Admin"
-ZABBIX_PASS = "zabbix"
-
-def zabbix_request(method, params, auth=None):
-    payload = {
-        "jsonrpc": "2.0",
-        "method": method,
-        "params": params,
-        "id": 1
-    }
-    if auth:
-        payload["auth"] = auth
+import lab_inventory
+from zabbix_api import ZabbixAPI, ZabbixError
+
+GROUPS = ["ha_cluster", "zabbix_agents"]
+METRICS = [("CPU", "CPU utilization"), ("Memory", "Memory utilization")]
+DASHBOARD = "CERBERUS - Cluster Monitoring"
+CACHE = os.path.expanduser("~/.cache/cerberus-dashboard.json")
+
+# Zabbix 7.0 dashboard grid
+GRID_W, GRID_H = 72, 64
+GRAPH_H = 5
+
+SUMMARY = [
+    {"type": "hostavail", "name": "Nodes Availability", "x": 0, "y": 0, "width": 35, "height": 5, "fields": []},
+    {"type": "problems", "name": "Cluster Alerts", "x": 35, "y": 0, "width": 37, "height": 5, "fields": []},
+    {"type": "systeminfo", "name": "Zabbix Server Info", "x": 0, "y": 5, "width": 35, "height": 6, "fields": []},
+    {"type": "problemhosts", "name": "Problem Hosts", "x": 35, "y": 5, "width": 37, "height": 6, "fields": []},
+]
+
+
+def fetch(api, hosts, dashboardid=None, cached=None):
+    """Hosts, graphs (with their host) and the current dashboard in a single batch round-trip.
+    With `cached` graph ids, graph.get (the largest reply) is left out and those are returned."""
+    where = {"dashboardids": [dashboardid]} if dashboardid else {"filter": {"name": DASHBOARD}}
+    calls = [
+        ("host.get", {"output": ["hostid", "host"], "filter": {"host": hosts}}),
+        ("dashboard.get", dict(where, output=["dashboardid", "name"], selectPages="extend")),
+    ]
+    if cached is None:
+        calls.append(("graph.get", {"output": ["graphid", "name"], "templated": False,
+                                    "search": {"name": [m[1] for m in METRICS]}, "searchByAny": True,
+                                    "selectHosts": ["hostid", "host"]}))
+    found, existing, *graphs = api.batch(calls)
+    if cached is not None:
+        return found, cached, existing[0] if existing else None
+    # graph_ids[(label, host)] = graphid
+    graph_ids = {}
+    for g in graphs[0]:
+        for label, search in METRICS:
+            if search in g["name"]:
+                for h in g.get("hosts", []):
+                    graph_ids.setdefault((label, h["host"]), g["graphid"])
+    return found, graph_ids, existing[0] if existing else None
+
+
+def layout(hosts, graph_ids):
+    """Summary widgets, then one block of graphs per metric laid out on a grid.
+    Rows that no longer fit on a page continue on a new page."""
+    cols = 2 if len(hosts) <= 4 else 3 if len(hosts) <= 9 else 4
+    width = GRID_W // cols
+    pages = [{"name": "Cluster Overview", "widgets": [dict(w) for w in SUMMARY]}]
+    y = max(w["y"] + w["height"] for w in SUMMARY)
+    for label, _ in METRICS:
+        cells = [(h, graph_ids[(label, h)]) for h in hosts if (label, h) in graph_ids]
+        for i, (host, graphid) in enumerate(cells):
+            col = i % cols
+            if col == 0 and i:
+                y += GRAPH_H
+            if y + GRAPH_H > GRID_H:
+                pages.append({"name": f"Cluster Overview ({len(pages) + 1})", "widgets": []})
+                y = 0
+            pages[-1]["widgets"].append({
+                "type": "graph",
+                "name": f"{label} {host}",
+                "x": col * width, "y": y, "width": width, "height": GRAPH_H,
+                "fields": [{"type": 6, "name": "graphid.0", "value": graphid}]
+            })
+        if cells:
+            y += GRAPH_H
+    return pages
+
+
+def reuse_ids(pages, existing):
+    """Carry page and widget ids over from the live dashboard so dashboard.update edits in place."""
+    old_pages = existing.get("pages", [])
+    for i, page in enumerate(pages):
+        if i >= len(old_pages):
+            break
+        if "dashboard_pageid" in old_pages[i]:
+            page["dashboard_pageid"] = old_pages[i]["dashboard_pageid"]
+        old_widgets = {w["name"]: w["widgetid"] for w in old_pages[i].get("widgets", []) if "widgetid" in w}
+        for w in page["widgets"]:
+            if w["name"] in old_widgets:
+                w["widgetid"] = old_widgets[w["name"]]
+    return pages
+
+
+def signature(pages):
+    return hashlib.sha256(json.dumps(pages, sort_keys=True).encode()).hexdigest()
+
+
+def load_cache():
     try:
-        response = requests.post(ZABBIX_URL, json=payload, timeout=30)
-        return response.json()
-    except Exception as e:
-        print(f"Error: {e}")
+        with open(CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
         return {}
 
+
+def save_cache(data):
+    os.makedirs(os.path.dirname(CACHE), exist_ok=True)
+    with open(CACHE, "w") as f:
+        json.dump(data, f, indent=1)
+
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inventory", default=lab_inventory.DEFAULT_PATH)
+    parser.add_argument("--refresh", action="store_true", help="look graphs up again instead of using the cache")
+    args = parser.parse_args()
+
+    hosts = lab_inventory.hosts(*GROUPS, path=args.inventory)
+    print(f"[*] Inventory hosts: {', '.join(hosts)}")
+
     # Login
     print("[*] Connecting to Zabbix API...")
-    result = zabbix_request("user.login", {"username": ZABBIX_USER, "password": ZABBIX_PASS})
-    auth_token = result.get("result")
-    if not auth_token:
-        print("[!] Login failed!")
+    api = ZabbixAPI()
+    try:
+        api.login()
+    except ZabbixError as e:
+        print(f"[!] Login failed! {e}")
         sys.exit(1)
     print("[+] Logged in successfully")
 
-    # Get host IDs for node01 and node02
-    print("[*] Fetching hosts...")
-    result = zabbix_request("host.get", {
-        "output": ["hostid", "host"],
-        "filter": {"host": ["node01", "node02"]}
-    }, auth_token)
-    hosts = result.get("result", [])
-    
-    if len(hosts) < 2:
-        print("[!] Hosts node01/node02 not found in Zabbix!")
+    cache = load_cache()
+    # graphid per (metric, host) from the last run, usable while every host still has the same hostid
+    cached = {tuple(k.split("/", 1)): v for k, v in cache.get("graphs", {}).items()}
+    if args.refresh or any((label, h) not in cached for label, _ in METRICS for h in hosts):
+        cached = None
+    print(f"[*] Fetching hosts{'' if cached else ', graphs'} and dashboard...")
+    try:
+        found, graph_ids, existing = fetch(api, hosts, cache.get("dashboardid"), cached)
+        if cached and {h["host"]: h["hostid"] for h in found} != {h: cache.get("hostids", {}).get(h) for h in hosts}:
+            # A host was added again since (new hostid, new graphs): the cached graph ids are stale
+            print("[*] Hosts changed since the last run, fetching graphs...")
+            cached = None
+            found, graph_ids, existing = fetch(api, hosts, cache.get("dashboardid"))
+        if not existing and cache.get("dashboardid"):
+            # Cached id is gone (dashboard deleted by hand): look it up by name instead
+            found, graph_ids, existing = fetch(api, hosts, cached=cached)
+    except ZabbixError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    missing = sorted(set(hosts) - {h["host"] for h in found})
+    if len(missing) == len(hosts):
+        print(f"[!] Hosts {'/'.join(hosts)} not found in Zabbix!")
         print("[!] Make sure Zabbix agents are configured and hosts are added.")
         sys.exit(1)
+    if missing:
+        print(f"[!] Not in Zabbix yet: {', '.join(missing)}")
 
-    node01_id = None
-    node02_id = None
-    for h in hosts:
-        if h["host"] == "node01":
-            node01_id = h["hostid"]
-        elif h["host"] == "node02":
-            node02_id = h["hostid"]
-
-    print(f"[+] node01 ID: {node01_id}")
-    print(f"[+] node02 ID: {node02_id}")
-
-    # Get CPU graphs
-    print("[*] Fetching CPU graphs...")
-    result = zabbix_request("graph.get", {
-        "output": ["graphid", "name"],
-        "hostids": [node01_id, node02_id],
-        "search": {"name": "CPU utilization"}
-    }, auth_token)
-    cpu_graphs = result.get("result", [])
-
-    cpu_node01 = None
-    cpu_node02 = None
-    for g in cpu_graphs:
-        result2 = zabbix_request("graph.get", {
-            "output": ["graphid"],
-            "graphids": [g["graphid"]],
-            "selectHosts": ["hostid"]
-        }, auth_token)
-        if result2.get("result"):
-            graph_host = result2["result"][0].get("hosts", [{}])[0].get("hostid")
-            if graph_host == node01_id:
-                cpu_node01 = g["graphid"]
-            elif graph_host == node02_id:
-                cpu_node02 = g["graphid"]
-
-    print(f"[+] CPU graph node01: {cpu_node01}")
-    print(f"[+] CPU graph node02: {cpu_node02}")
-
-    # Get Memory graphs
-    print("[*] Fetching Memory graphs...")
-    result = zabbix_request("graph.get", {
-        "output": ["graphid", "name"],
-        "hostids": [node01_id, node02_id],
-        "search": {"name": "Memory utilization"}
-    }, auth_token)
-    mem_graphs = result.get("result", [])
-
-    mem_node01 = None
-    mem_node02 = None
-    for g in mem_graphs:
-        result2 = zabbix_request("graph.get", {
-            "output": ["graphid"],
-            "graphids": [g["graphid"]],
-            "selectHosts": ["hostid"]
-        }, auth_token)
-        if result2.get("result"):
-            graph_host = result2["result"][0].get("hosts", [{}])[0].get("hostid")
-            if graph_host == node01_id:
-                mem_node01 = g["graphid"]
-            elif graph_host == node02_id:
-                mem_node02 = g["graphid"]
-
-    print(f"[+] Memory graph node01: {mem_node01}")
-    print(f"[+] Memory graph node02: {mem_node02}")
-
-    # Delete existing dashboard
-    print("[*] Checking for existing dashboard...")
-    result = zabbix_request("dashboard.get", {
-        "output": ["dashboardid"],
-        "filter": {"name": "CERBERUS - Cluster Monitoring"}
-    }, auth_token)
-    existing = result.get("result", [])
-    if existing:
-        zabbix_request("dashboard.delete", [existing[0]["dashboardid"]], auth_token)
-        print("[+] Deleted existing dashboard")
-
-    # Create widgets list
-    widgets = [
-        {
-            "type": "hostavail",
-            "name": "Nodes Availability",
-            "x": 0, "y": 0, "width": 35, "height": 5,
-            "fields": []
-        },
-        {
-            "type": "problems",
-            "name": "Cluster Alerts",
-            "x": 35, "y": 0, "width": 37, "height": 5,
-            "fields": []
-        },
-        {
-            "type": "systeminfo",
-            "name": "Zabbix Server Info",
-            "x": 0, "y": 5, "width": 35, "height": 6,
-            "fields": []
-        },
-        {
-            "type": "problemhosts",
-            "name": "Problem Hosts",
-            "x": 35, "y": 5, "width": 37, "height": 6,
-            "fields": []
-        }
-    ]
+    for label, _ in METRICS:
+        have = [h for h in hosts if (label, h) in graph_ids]
+        print(f"[+] {label} graphs: {len(have)}/{len(hosts)}")
 
-    # Add CPU/Memory graphs if found
-    if cpu_node01:
-        widgets.append({
-            "type": "graph",
-            "name": "CPU node01",
-            "x": 0, "y": 11, "width": 36, "height": 5,
-            "fields": [{"type": 6, "name": "graphid.0", "value": cpu_node01}]
-        })
-    if cpu_node02:
-        widgets.append({
-            "type": "graph",
-            "name": "CPU node02",
-            "x": 36, "y": 11, "width": 36, "height": 5,
-            "fields": [{"type": 6, "name": "graphid.0", "value": cpu_node02}]
-        })
-    if mem_node01:
-        widgets.append({
-            "type": "graph",
-            "name": "Memory node01",
-            "x": 0, "y": 16, "width": 36, "height": 5,
-            "fields": [{"type": 6, "name": "graphid.0", "value": mem_node01}]
-        })
-    if mem_node02:
-        widgets.append({
-            "type": "graph",
-            "name": "Memory node02",
-            "x": 36, "y": 16, "width": 36, "height": 5,
-            "fields": [{"type": 6, "name": "graphid.0", "value": mem_node02}]
-        })
-
-    # Create dashboard
-    print("[*] Creating dashboard...")
-    result = zabbix_request("dashboard.create", {
-        "name": "CERBERUS - Cluster Monitoring",
-        "display_period": 60,
-        "auto_start": 1,
-        "pages": [{
-            "name": "Cluster Overview",
-            "widgets": widgets
-        }]
-    }, auth_token)
-
-    if result.get("result"):
-        print("[+] Dashboard 'CERBERUS - Cluster Monitoring' created successfully!")
-        print(f"[+] Dashboard ID: {result['result']['dashboardids'][0]}")
-    else:
-        print(f"[!] Error: {result.get('error', 'Unknown error')}")
+    pages = layout(hosts, graph_ids)
+    sig = signature(pages)
+    widgets = sum(len(p["widgets"]) for p in pages)
+
+    try:
+        if existing and cache.get("dashboardid") == existing["dashboardid"] and cache.get("signature") == sig:
+            print(f"[+] Dashboard '{DASHBOARD}' is up to date")
+        elif existing:
+            print(f"[*] Updating dashboard ({widgets} widgets, {len(pages)} page(s))...")
+            api.call("dashboard.update", {"dashboardid": existing["dashboardid"], "pages": reuse_ids(pages, existing)})
+            print(f"[+] Dashboard '{DASHBOARD}' updated in place")
+        else:
+            print(f"[*] Creating dashboard ({widgets} widgets, {len(pages)} page(s))...")
+            result = api.call("dashboard.create", {
+                "name": DASHBOARD,
+                "display_period": 60,
+                "auto_start": 1,
+                "pages": pages
+            })
+            existing = {"dashboardid": result["dashboardids"][0]}
+            print(f"[+] Dashboard '{DASHBOARD}' created successfully!")
+    except ZabbixError as e:
+        print(f"[!] Error: {e}")
         sys.exit(1)
 
+    save_cache({"dashboardid": existing["dashboardid"], "signature": sig,
+                "hostids": {h["host"]: h["hostid"] for h in found},
+                "graphs": {f"{label}/{host}": gid for (label, host), gid in graph_ids.items() if host in hosts}})
+    print(f"[+] Dashboard ID: {existing['dashboardid']}")
+    print(f"[+] {api.calls} API round-trips")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+CERBERUS - Zabbix history exporter
+Pulls numeric history/trends for every zabbix_agents host into a columnar on-disk
+store (one flat file per item and column) and prints per-host aggregates
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import lab_inventory
+from zabbix_api import ZabbixAPI, ZabbixError, ZABBIX_URL
+
+try:
+    import numpy as np
+except ImportError:
+    print("[!] numpy is required: pip3 install numpy")
+    sys.exit(1)
+
+NUMERIC = {"0": "float", "3": "unsigned"}
+# history.get/trend.get value columns stored per source (all as float64, clock as int64)
+SOURCES = {
+    "history": {"method": "history.get", "columns": ["value"]},
+    "trends": {"method": "trend.get", "columns": ["value_avg", "value_min", "value_max"]},
+}
+CHUNK = 6 * 3600      # seconds per time window
+LIMIT = 100000        # rows per call before a window is split
+PER_BATCH = 8         # windows sent per JSON-RPC batch
+
+
+class Store:
+    """<root>/<source>/<host>/<itemid>.<column>: raw little-endian arrays, appended in clock order
+    and read back with np.memmap. meta.json keeps item names and the last stored clock."""
+
+    def __init__(self, root, source):
+        self.dir = os.path.join(root, source)
+        self.columns = ["clock"] + SOURCES[source]["columns"]
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        os.makedirs(self.dir, exist_ok=True)
+        try:
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        except (OSError, ValueError):
+            self.meta = {}
+
+    def _path(self, host, itemid, col):
+        return os.path.join(self.dir, host, f"{itemid}.{col}")
+
+    def dtype(self, col):
+        return np.dtype("<i8") if col == "clock" else np.dtype("<f8")
+
+    def append(self, host, itemid, cols):
+        os.makedirs(os.path.join(self.dir, host), exist_ok=True)
+        for col in self.columns:
+            with open(self._path(host, itemid, col), "ab") as f:
+                f.write(np.asarray(cols[col], dtype=self.dtype(col)).tobytes())
+        self.meta[itemid]["last_clock"] = max(self.meta[itemid]["last_clock"], int(cols["clock"][-1]))
+
+    def read(self, host, itemid, col):
+        path = self._path(host, itemid, col)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(0, dtype=self.dtype(col))
+        return np.memmap(path, dtype=self.dtype(col), mode="r")
+
+    def save(self):
+        with open(self.meta_path + ".tmp", "w") as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+
+def discover(api, hosts):
+    """Numeric, monitored items of the inventory hosts: {itemid: {host, key, name, value_type}}."""
+    found = api.call("host.get", {"output": ["hostid", "host"], "filter": {"host": hosts}})
+    names = {h["hostid"]: h["host"] for h in found}
+    if not names:
+        return {}
+    items = api.call("item.get", {"output": ["itemid", "hostid", "key_", "name", "value_type"],
+                                  "hostids": list(names), "monitored": True,
+                                  "filter": {"value_type": list(NUMERIC)}})
+    return {i["itemid"]: {"host": names[i["hostid"]], "key": i["key_"], "name": i["name"],
+                          "value_type": i["value_type"]} for i in items}
+
+
+def windows(start, end):
+    return [(a, min(a + CHUNK, end) - 1) for a in range(start, end, CHUNK)]
+
+
+def export(api, store, source, items, days):
+    """Fetch everything newer than each item's last stored clock, PER_BATCH windows per round-trip."""
+    method, columns = SOURCES[source]["method"], SOURCES[source]["columns"]
+    now = int(time.time())
+    for itemid, info in items.items():
+        store.meta.setdefault(itemid, dict(info, last_clock=0))
+    # Items that share a value type and start clock go in the same calls
+    groups = {}
+    for itemid, m in store.meta.items():
+        if itemid in items:
+            start = max(m["last_clock"] + 1, now - days * 86400)
+            groups.setdefault((m["value_type"], start), []).append(itemid)
+
+    rows = 0
+    for (vtype, start), ids in groups.items():
+        todo = windows(start, now)
+        while todo:
+            batch, todo = todo[:PER_BATCH], todo[PER_BATCH:]
+            params = [{"output": ["itemid", "clock"] + columns, "itemids": ids, "time_from": a, "time_till": b,
+                       "sortfield": "clock", "sortorder": "ASC", "limit": LIMIT} for a, b in batch]
+            if source == "history":
+                for p in params:
+                    p["history"] = int(vtype)
+            else:
+                for p in params:
+                    del p["sortfield"], p["sortorder"]
+            results = api.batch([(method, p) for p in params])
+            for i, ((a, b), result) in enumerate(zip(batch, results)):
+                if len(result) >= LIMIT and b > a:
+                    # Window too dense: split it and fetch both halves again, then the rest of the batch,
+                    # so every item's rows are still appended in clock order
+                    mid = (a + b) // 2
+                    todo[:0] = [(a, mid), (mid + 1, b)] + batch[i + 1:]
+                    break
+                rows += len(result)
+                ingest(store, result, columns)
+    return rows
+
+
+def ingest(store, result, columns):
+    if not result:
+        return
+    itemid = np.array([r["itemid"] for r in result])
+    clock = np.array([r["clock"] for r in result], dtype=np.int64)
+    values = {c: np.array([r[c] for r in result], dtype=np.float64) for c in columns}
+    order = np.lexsort((clock, itemid))
+    itemid, clock = itemid[order], clock[order]
+    values = {c: v[order] for c, v in values.items()}
+    bounds = np.flatnonzero(itemid[1:] != itemid[:-1]) + 1
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(itemid)]):
+        iid = str(itemid[lo])
+        store.append(store.meta[iid]["host"], iid, dict({"clock": clock[lo:hi]}, **{c: v[lo:hi] for c, v in values.items()}))
+
+
+def rolling_mean(clock, value, window):
+    """Mean over the trailing `window` seconds at every sample (clock must be sorted)."""
+    csum = np.concatenate(([0.0], np.cumsum(value)))
+    left = np.searchsorted(clock, clock - window, side="left")
+    idx = np.arange(1, len(clock) + 1)
+    return (csum[idx] - csum[left]) / (idx - left)
+
+
+def aggregate(store, column, window):
+    """Per item: samples, mean, p50/p95/p99, max and the peak of the rolling mean."""
+    out = {}
+    for itemid, m in store.meta.items():
+        clock = store.read(m["host"], itemid, "clock")
+        value = np.asarray(store.read(m["host"], itemid, column))
+        if not len(value):
+            continue
+        p50, p95, p99 = np.percentile(value, [50, 95, 99])
+        clock = np.asarray(clock)
+        rolling = rolling_mean(clock, value, window)
+        # Ignore the first partial window so a few early samples can't set the peak
+        full = clock >= clock[0] + window
+        out.setdefault(m["host"], []).append({
+            "itemid": itemid, "key": m["key"], "name": m["name"], "samples": int(len(value)),
+            "from": int(clock[0]), "to": int(clock[-1]), "mean": float(value.mean()),
+            "p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(value.max()),
+            "peak_rolling": float(rolling[full].max() if full.any() else rolling.max()),
+        })
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Zabbix history into a columnar store")
+    parser.add_argument("--inventory", default=lab_inventory.DEFAULT_PATH)
+    parser.add_argument("--url", default=ZABBIX_URL)
+    parser.add_argument("--out", default=os.path.expanduser("~/cerberus-history"))
+    parser.add_argument("--source", choices=list(SOURCES), default="history")
+    parser.add_argument("--days", type=int, default=7, help="how far back the first export goes")
+    parser.add_argument("--window", type=int, default=3600, help="rolling window in seconds")
+    parser.add_argument("--match", default="", help="only report items whose key contains this")
+    parser.add_argument("--no-fetch", action="store_true", help="only aggregate what is already stored")
+    parser.add_argument("--json", action="store_true", help="print aggregates as JSON")
+    args = parser.parse_args()
+
+    store = Store(args.out, args.source)
+    hosts = lab_inventory.hosts("zabbix_agents", path=args.inventory)
+
+    if not args.no_fetch:
+        print(f"[*] Connecting to Zabbix API ({args.url})...")
+        api = ZabbixAPI(args.url)
+        try:
+            api.login()
+            items = discover(api, hosts)
+            print(f"[+] {len(items)} numeric items on {', '.join(hosts)}")
+            t = time.time()
+            rows = export(api, store, args.source, items, args.days)
+        except ZabbixError as e:
+            print(f"[!] Error: {e}")
+            sys.exit(1)
+        finally:
+            store.save()
+        print(f"[+] {rows} new rows in {time.time() - t:.1f}s ({api.calls} API round-trips) -> {store.dir}")
+
+    column = SOURCES[args.source]["columns"][0]
+    stats = aggregate(store, column, args.window)
+    for host in stats:
+        stats[host] = [s for s in stats[host] if args.match in s["key"]]
+    if args.json:
+        print(json.dumps(stats, indent=1))
+        return
+    for host, rows in sorted(stats.items()):
+        print(f"\n=== {host} ===")
+        print(f"  {'key':<40} {'n':>7} {'mean':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10} {'peak ' + str(args.window) + 's':>12}")
+        for s in sorted(rows, key=lambda s: s["key"]):
+            print(f"  {s['key'][:40]:<40} {s['samples']:>7} {s['mean']:>10.2f} {s['p50']:>10.2f} {s['p95']:>10.2f}"
+                  f" {s['p99']:>10.2f} {s['max']:>10.2f} {s['peak_rolling']:>12.2f}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+CERBERUS - Ansible INI inventory reader
+Resolves groups (including :children) to host lists without needing Ansible installed
+"""
+import os
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "inventory", "hosts")
+
+
+def parse(path=DEFAULT_PATH):
+    """Returns (groups, hostvars): groups[name] = direct hosts, with ':children' kept under 'name:children'."""
+    groups, hostvars = {}, {}
+    section = None
+    with open(path, encoding="utf-8") as f:
+        for raw in f:
+            line = raw.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                section = line[1:-1]
+                groups.setdefault(section, [])
+                continue
+            if section is None or section.endswith(":vars"):
+                continue
+            name, *pairs = line.split()
+            groups[section].append(name)
+            if not section.endswith(":children"):
+                hostvars.setdefault(name, {}).update(p.split("=", 1) for p in pairs if "=" in p)
+    return groups, hostvars
+
+
+def hosts(*group_names, path=DEFAULT_PATH):
+    """Hosts of the given groups in inventory order, children resolved and duplicates dropped."""
+    groups, _ = parse(path)
+    out = []
+
+    def walk(g, seen):
+        if g in seen:
+            return
+        seen.add(g)
+        for h in groups.get(g, []):
+            if h not in out:
+                out.append(h)
+        for child in groups.get(f"{g}:children", []):
+            walk(child, seen)
+
+    for g in group_names:
+        walk(g, set())
+    return out
+
+
+def host_vars(name, path=DEFAULT_PATH):
+    return parse(path)[1].get(name, {})
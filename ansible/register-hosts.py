@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+CERBERUS - Zabbix host registration
+Creates or fixes up every zabbix_agents host of the inventory in Zabbix: agent interface,
+host group and template. One batch reads the current state and one batch writes the
+difference, whatever the number of hosts; a second run changes nothing
+"""
+import argparse
+import sys
+import lab_inventory
+from zabbix_api import ZabbixAPI, ZabbixError, ZABBIX_URL
+
+GROUP = "Linux servers"
+TEMPLATE = "Linux by Zabbix agent"
+AGENT = "1"   # interface type: Zabbix agent
+
+
+def fetch(api, names, group, template):
+    """Host group, template and the already registered hosts in a single batch round-trip."""
+    groups, templates, found = api.batch([
+        ("hostgroup.get", {"output": ["groupid", "name"], "filter": {"name": [group]}}),
+        ("template.get", {"output": ["templateid", "host"], "filter": {"host": [template]}}),
+        ("host.get", {"output": ["hostid", "host"], "filter": {"host": names},
+                      "selectInterfaces": ["interfaceid", "type", "main", "useip", "ip", "port"],
+                      "selectHostGroups": ["groupid"], "selectParentTemplates": ["templateid"]}),
+    ])
+    groupid = next((g["groupid"] for g in groups if g["name"] == group), None)
+    templateid = next((t["templateid"] for t in templates if t["host"] == template), None)
+    return groupid, templateid, {h["host"]: h for h in found}
+
+
+def plan(hosts, found, groupid, templateid, port):
+    """The write batch: [(method, params)] covering every host, plus per-host actions for the report."""
+    create, link, add_if, fix_if, actions = [], [], [], [], {}
+    for name, ip in hosts.items():
+        interface = {"type": int(AGENT), "main": 1, "useip": 1, "ip": ip, "dns": "", "port": port}
+        h = found.get(name)
+        if not h:
+            create.append({"host": name, "interfaces": [interface],
+                           "groups": [{"groupid": groupid}], "templates": [{"templateid": templateid}]})
+            actions[name] = "created"
+            continue
+        todo = []
+        if groupid not in {g["groupid"] for g in h.get("hostgroups", [])} \
+                or templateid not in {t["templateid"] for t in h.get("parentTemplates", [])}:
+            link.append({"hostid": h["hostid"]})
+            todo.append("linked")
+        agent = next((i for i in h.get("interfaces", []) if str(i["type"]) == AGENT and str(i["main"]) == "1"), None)
+        if not agent:
+            add_if.append(dict(interface, hostid=h["hostid"]))
+            todo.append("interface added")
+        elif (agent["ip"], str(agent["port"]), str(agent["useip"])) != (ip, port, "1"):
+            fix_if.append({"interfaceid": agent["interfaceid"], "ip": ip, "port": port, "useip": 1})
+            todo.append(f"interface {agent['ip']}:{agent['port']} -> {ip}:{port}")
+        if todo:
+            actions[name] = ", ".join(todo)
+
+    calls = []
+    if create:
+        calls.append(("host.create", create))
+    if link:
+        calls.append(("host.massadd", {"hosts": link, "groups": [{"groupid": groupid}],
+                                       "templates": [{"templateid": templateid}]}))
+    if add_if:
+        calls.append(("hostinterface.create", add_if))
+    if fix_if:
+        calls.append(("hostinterface.update", fix_if))
+    return calls, actions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inventory", default=lab_inventory.DEFAULT_PATH)
+    parser.add_argument("--url", default=ZABBIX_URL)
+    parser.add_argument("--group", default=GROUP)
+    parser.add_argument("--template", default=TEMPLATE)
+    parser.add_argument("--port", default="10050", help="agent port")
+    parser.add_argument("--check", action="store_true", help="only show what would change")
+    args = parser.parse_args()
+
+    names = lab_inventory.hosts("zabbix_agents", path=args.inventory)
+    hostvars = lab_inventory.parse(args.inventory)[1]
+    hosts = {n: hostvars.get(n, {}).get("ansible_host", n) for n in names}
+    print(f"[*] Inventory hosts: {len(hosts)}")
+
+    api = ZabbixAPI(args.url)
+    try:
+        api.login()
+        groupid, templateid, found = fetch(api, names, args.group, args.template)
+    except ZabbixError as e:
+        print(f"[!] Error: {e}")
+        sys.exit(1)
+    if not groupid or not templateid:
+        print(f"[!] Host group '{args.group}' or template '{args.template}' not found in Zabbix!")
+        sys.exit(1)
+
+    calls, actions = plan(hosts, found, groupid, templateid, args.port)
+    created = sum(1 for a in actions.values() if a == "created")
+    if created:
+        print(f"[*] Not in Zabbix yet: {created}")
+    for name, action in actions.items():
+        if action != "created":
+            print(f"[*] {name}: {action}")
+    if not calls:
+        print(f"[+] All {len(hosts)} hosts up to date ({api.calls} API round-trips)")
+        return
+    if args.check:
+        print(f"[*] {len(actions)} of {len(hosts)} hosts would change")
+        return
+
+    try:
+        api.batch(calls)
+    except ZabbixError as e:
+        print(f"[!] Error: {e}")
+        sys.exit(1)
+    print(f"[+] {created} created, {len(actions) - created} updated, {len(hosts) - len(actions)} unchanged "
+          f"({api.calls} API round-trips)")
+
+
+if __name__ == "__main__":
+    main()
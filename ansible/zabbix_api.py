@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+CERBERUS - Zabbix JSON-RPC client
+One pooled HTTP session, token reuse and batched calls for the lab tooling
+"""
+import itertools
+import os
+import requests
+
+ZABBIX_URL = os.environ.get("ZABBIX_URL", "http://localhost/api_jsonrpc.php")
+ZABBIX_USER = "Admin"
+ZABBIX_PASS = "zabbix"
+
+
+class ZabbixError(Exception):
+    pass
+
+
+class ZabbixAPI:
+    def __init__(self, url=ZABBIX_URL, user=ZABBIX_USER, password=ZABBIX_PASS, token=None, timeout=30):
+        self.url, self.user, self.password, self.timeout = url, user, password, timeout
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json-rpc"
+        self.ids = itertools.count(1)
+        self.calls = 0
+        self.token = None
+        token = token or os.environ.get("ZABBIX_TOKEN")
+        if token:
+            self._use_token(token)
+
+    def _use_token(self, token):
+        self.token = token
+        self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def _payload(self, method, params):
+        return {"jsonrpc": "2.0", "method": method, "params": params, "id": next(self.ids)}
+
+    def _post(self, body):
+        self.calls += 1
+        try:
+            response = self.session.post(self.url, json=body, timeout=self.timeout)
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ZabbixError(f"{self.url}: {e}")
+
+    @staticmethod
+    def _result(reply):
+        if "error" in reply:
+            err = reply["error"]
+            raise ZabbixError(f"{err.get('message')} {err.get('data', '')}".strip())
+        return reply.get("result")
+
+    def login(self):
+        """Log in once; later calls reuse the token through the session's Authorization header."""
+        if not self.token:
+            self.session.headers.pop("Authorization", None)
+            self._use_token(self.call("user.login", {"username": self.user, "password": self.password}))
+        return self
+
+    def call(self, method, params=None):
+        return self._result(self._post(self._payload(method, params if params is not None else {})))
+
+    def batch(self, calls):
+        """Send [(method, params), ...] as one JSON-RPC batch; results come back in the same order."""
+        if not calls:
+            return []
+        payloads = [self._payload(m, p) for m, p in calls]
+        replies = self._post(payloads)
+        if isinstance(replies, dict):
+            # The whole batch was rejected (e.g. bad token)
+            raise ZabbixError(str(replies.get("error", replies)))
+        by_id = {r.get("id"): r for r in replies}
+        return [self._result(by_id.get(p["id"], {"error": {"message": f"no reply for {p['method']}"}}))
+                for p in payloads]
+
+    def close(self):
+        self.session.close()
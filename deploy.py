@@ -3,7 +3,10 @@
 Cerberus - High Availability Infrastructure Lab
 By Mishka-sys
 """
-import os, sys, subprocess, time, shutil, glob, re, argparse
+import os, sys, subprocess, time, shutil, glob, re, argparse, threading, socket, random, json, math
+import tempfile, hashlib, mmap, signal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
 # Fix Windows encoding
@@ -26,30 +29,1012 @@ OK = f"{Colors.GREEN}[+]{Colors.ENDC}"
 ERR = f"{Colors.EMBER}[x]{Colors.ENDC}"
 INFO = f"{Colors.FIRE}[!]{Colors.ENDC}"
 
+def pool(n):
+    """Thread pool whose workers are named after the calling thread, so they stay attributed to its job."""
+    return ThreadPoolExecutor(n, thread_name_prefix=threading.current_thread().name + "/")
+
 class ProgressBar:
-    def __init__(self, total):
-        self.total = total
+    """One status line per lane plus an overall bar, redrawn in place. A lane can carry a `view`
+    (PlaybookProgress) that adds its own lines and moves the bar while its phase runs."""
+    def __init__(self, total, lanes=("main",), live=True):
+        self.total, self.n = total, 0
+        self.lanes = {l: ("waiting", None) for l in lanes}
+        self.views = {}
         self.start = time.time()
-    def update(self, n, txt):
+        self.live = live and sys.stdout.isatty()
+        self.lock = threading.Lock()
+        self.drawn = 0
+    def _fmt(self, secs):
+        return f"{int(secs//60):02d}:{int(secs%60):02d}"
+    def update(self, lane, txt, t0=None, done=False):
+        with self.lock:
+            if done: self.n += 1
+            self.lanes[lane] = (txt, t0)
+            self.views.pop(lane, None)
+            if self.live: self._draw()
+            else: print(f"[{self._fmt(time.time()-self.start)}] {lane}: {txt}")
+    def view(self, lane, view):
+        """Attach a live view to the lane's running phase, until the lane's next update()."""
+        with self.lock: self.views[lane] = view
+    def tick(self):
+        if self.live:
+            with self.lock: self._draw()
+    def _draw(self):
+        now = time.time()
+        if self.drawn: sys.stdout.write(f"\033[{self.drawn}F")
+        n = min(self.total, self.n + sum(v.fraction() or 0 for v in self.views.values()))
         pct = int(100*n/self.total)
         filled = int(40*n/self.total)
         bar = f"{Colors.FIRE}{'#'*filled}{Colors.SMOKE}{'-'*(40-filled)}{Colors.ENDC}"
-        elapsed = time.time() - self.start
-        sys.stdout.write(f"\r[{bar}] {Colors.GOLD}{pct:3d}%{Colors.ENDC} | {n}/{self.total} | {Colors.PURPLE}{txt[:25]:<25}{Colors.ENDC} | {int(elapsed//60):02d}:{int(elapsed%60):02d}")
+        sys.stdout.write(f"\033[2K[{bar}] {Colors.GOLD}{pct:3d}%{Colors.ENDC} | {self.n}/{self.total} | {self._fmt(now-self.start)}\n")
+        lines = 1
+        width = shutil.get_terminal_size().columns - 1
+        for lane, (txt, t0) in self.lanes.items():
+            el = self._fmt(now-t0) if t0 else "     "
+            sys.stdout.write(f"\033[2K  {Colors.ASH}{lane:<8}{Colors.ENDC} {Colors.PURPLE}{txt[:25]:<25}{Colors.ENDC} {el}\n")
+            lines += 1
+            if lane in self.views:
+                for l in self.views[lane].lines(now):
+                    sys.stdout.write(f"\033[2K{' '*11}{Colors.ASH}{l[:width-11]}{Colors.ENDC}\n")
+                    lines += 1
+        # A view that just went away leaves lines behind: blank them, then come back up
+        if lines < self.drawn: sys.stdout.write("\033[2K\n" * (self.drawn - lines) + f"\033[{self.drawn - lines}F")
         sys.stdout.flush()
+        self.drawn = lines
     def done(self):
-        self.update(self.total, "Complete")
-        print()
+        with self.lock:
+            self.n = self.total
+            self.views.clear()
+            if self.live: self._draw()
 
-class Lab:
+class Phase:
+    """A deployment step. `inputs` are files/dirs whose content decides whether a recorded run is still
+    valid; `always` phases (cheap and idempotent, like `vagrant up` or a probe) run even when valid."""
+    def __init__(self, name, fn, deps=(), lane="main", inputs=(), always=False):
+        self.name, self.fn, self.deps, self.lane = name, fn, tuple(deps), lane
+        self.inputs, self.always = tuple(inputs), always
+
+def tree_hash(*paths):
+    """Content hash of files and directory trees (paths + bytes), stable across platforms."""
+    h = hashlib.sha256()
+    for root in paths:
+        if os.path.isfile(root): files = [root]
+        else: files = sorted(os.path.join(d, f) for d, ds, fs in os.walk(root) for f in fs if "__pycache__" not in d)
+        if not files: h.update(f"{root}:missing\0".encode())
+        for f in files:
+            with open(f, "rb") as fh: h.update(f.replace(os.sep, "/").encode() + b"\0" + hashlib.sha256(fh.read()).digest())
+    return h.hexdigest()
+
+class PhaseState:
+    """Completed-phase checkpoints kept in .cerberus_state. A phase's key hashes its own inputs and the
+    keys of its deps, so changing a role invalidates that phase and everything downstream of it."""
+    def __init__(self, phases, path=".cerberus_state", resume=True):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        if resume and os.path.exists(path):
+            try:
+                with open(path) as f: self.done = json.load(f)
+            except ValueError: pass
+        by_name = {p.name: p for p in phases}
+        self.keys = {}
+        def key(n):
+            if n not in self.keys:
+                p = by_name[n]
+                self.keys[n] = hashlib.sha256("\0".join([n, tree_hash(*p.inputs)] + [key(d) for d in p.deps]).encode()).hexdigest()
+            return self.keys[n]
+        for n in by_name: key(n)
+
+    def fresh(self, p):
+        return not p.always and self.done.get(p.name, {}).get("key") == self.keys[p.name]
+
+    def record(self, p):
+        with self.lock:
+            self.done[p.name] = {"key": self.keys[p.name], "at": datetime.now().isoformat(timespec="seconds")}
+            with open(self.path + ".tmp", "w") as f: json.dump(self.done, f, indent=1)
+            os.replace(self.path + ".tmp", self.path)
+
+    @staticmethod
+    def clear(path=".cerberus_state"):
+        if os.path.exists(path): os.remove(path)
+
+class Scheduler:
+    """Runs a phase graph: each phase starts once all its deps are done, at most `workers` at a time.
+    With a PhaseState, phases whose checkpoint is still valid are skipped."""
+    def __init__(self, phases, workers=2, pb=None, state=None, on_skip=None):
+        self.phases = {p.name: p for p in phases}
+        self.workers, self.pb, self.state, self.on_skip = max(1, workers), pb, state, on_skip
+        for p in phases:
+            for d in p.deps:
+                if d not in self.phases: raise ValueError(f"{p.name}: unknown dependency '{d}'")
+
+    def _ready(self, done, running):
+        busy = set(running.values())
+        return [p for n, p in self.phases.items()
+                if n not in done and n not in busy and all(d in done for d in p.deps)]
+
+    def _skip_fresh(self, done, running):
+        while self.state:
+            fresh = [p for p in self._ready(done, running) if self.state.fresh(p)]
+            if not fresh: return
+            for p in fresh:
+                done.add(p.name)
+                if self.on_skip: self.on_skip(p)
+                if self.pb: self.pb.update(p.lane, f"{p.name} skipped", done=True)
+
+    def run(self):
+        done, running, failed = set(), {}, None
+        with pool(self.workers) as ex:
+            while len(done) < len(self.phases):
+                if not failed:
+                    self._skip_fresh(done, running)
+                    for p in self._ready(done, running)[:self.workers-len(running)]:
+                        if self.pb: self.pb.update(p.lane, p.name, time.time())
+                        running[ex.submit(p.fn)] = p.name
+                if not running:
+                    if failed or len(done) == len(self.phases): break
+                    raise Exception(f"Phase graph stuck (cycle?): {sorted(set(self.phases)-done)}")
+                finished, _ = wait(running, timeout=1, return_when=FIRST_COMPLETED)
+                if self.pb: self.pb.tick()
+                for f in finished:
+                    p = self.phases[running.pop(f)]
+                    try:
+                        f.result()
+                        done.add(p.name)
+                        if self.state: self.state.record(p)
+                        if self.pb: self.pb.update(p.lane, f"{p.name} ok", done=True)
+                    except Exception as e:
+                        failed = failed or e
+                        if self.pb: self.pb.update(p.lane, f"{p.name} FAILED")
+        if failed: raise failed
+        return done
+
+class Capture:
+    """Streams child output to the run log and stdout, keeping only the last `tail` lines in memory.
+    Pass `spill` to also write the full text to that file."""
+    def __init__(self, sink=None, tail=200, spill=None, echo=False, parser=None):
+        self.sink, self.echo, self.parser = sink, echo, parser
+        self.tail = deque(maxlen=tail)
+        self.spill = open(spill, "w", encoding='utf-8', errors='replace') if spill else None
+        self.lines = 0
+
+    def feed(self, line):
+        self.tail.append(line)
+        self.lines += 1
+        if self.echo:
+            try: sys.stdout.write(line)
+            except: pass
+        if self.sink: self.sink(line)
+        if self.spill: self.spill.write(line)
+        if self.parser: self.parser.feed(line)
+
+    def pump(self, stream):
+        for line in stream:
+            self.feed(line)
+            if self.parser and self.parser.done: break
+        return self
+
+    def close(self):
+        if self.parser: self.parser.close()
+        if self.spill: self.spill.close(); self.spill = None
+
+    def text(self):
+        return "".join(self.tail)
+
+class AnsibleStream:
+    """Incremental ansible-playbook output parser. Each finished task is reported to `on_task` with its
+    duration and per-host result; only lines that can be headers or host results are looked at."""
+    ANSI = re.compile(r"\x1b\[[0-9;]*m")
+    HEADER = re.compile(r"(PLAY|TASK|RUNNING HANDLER) \[(.*)\] \*")
+    RESULT = re.compile(r"(ok|changed|failed|fatal|skipping|unreachable): \[([^\]]+)\]")
+    RANK = {"skipping": 0, "ok": 1, "changed": 2, "failed": 3, "fatal": 3, "unreachable": 3}
+
+    done = False
+
+    def __init__(self, phase=None, on_task=None, on_play=None, on_start=None):
+        self.phase, self.on_task, self.on_play, self.on_start = phase, on_task, on_play, on_start
+        self.play = self.task = None
+        self.t0, self.hosts = 0, {}
+
+    def feed(self, line):
+        if "[" not in line and "PLAY RECAP" not in line: return
+        if "\x1b" in line: line = self.ANSI.sub("", line)
+        c = line[:1]
+        if c in "PTR":
+            m = self.HEADER.match(line)
+            if m:
+                self._close()
+                kind, title = m.groups()
+                if kind == "PLAY":
+                    self.play = title
+                    if self.on_play: self.on_play(title)
+                else:
+                    self.task, self.t0 = title, time.time()
+                    if self.on_start: self.on_start(title)
+            elif line.startswith("PLAY RECAP"): self._close()
+        elif self.task and c in "ocfsu":
+            m = self.RESULT.match(line)
+            if m:
+                status, host = m.group(1), m.group(2).split(" ->")[0]
+                if self.RANK[status] >= self.RANK.get(self.hosts.get(host), -1): self.hosts[host] = status
+
+    def _close(self):
+        if self.task and self.on_task:
+            self.on_task({"phase": self.phase, "play": self.play, "task": self.task,
+                          "secs": round(time.time() - self.t0, 2), "hosts": self.hosts})
+        self.task, self.hosts = None, {}
+
+    def close(self):
+        self._close()
+
+class PlaybookProgress:
+    """Live view of one playbook phase for a ProgressBar lane, fed by AnsibleStream: current role and
+    task, per-host ok/changed/failed counts, and an ETA from the median duration of each task over the
+    last successful runs of the same phase (the `task` events in logs/*.jsonl)."""
+    def __init__(self, pb, phase, runs=(), keep=5):
+        self.pb = pb
+        past = [r["tasks"] for r in runs if phase in r["phases"] and any(ph == phase for ph, _ in r["tasks"])][-keep:]
+        est = {}
+        for tasks in past:
+            for (ph, task), secs in tasks.items():
+                if ph == phase: est.setdefault(task, []).append(secs)
+        self.left = {t: percentile(v, 50) for t, v in est.items()}
+        self.total = sum(self.left.values())
+        self.roles = {}
+        for t in self.left:
+            r = self.roles.setdefault(self.role(t), [0, 0])
+            r[1] += 1
+        self.task, self.t0, self.cur, self.n = None, 0, 0, 0
+        self.hosts = {}
+
+    @staticmethod
+    def role(task):
+        return task.split(" : ", 1)[0] if " : " in task else "play"
+
+    def start(self, task):
+        with self.pb.lock:
+            self.task, self.t0 = task, time.time()
+            self.cur = self.left.pop(task, 0)
+
+    def finish(self, t):
+        with self.pb.lock:
+            self.n += 1
+            self.roles.setdefault(self.role(t["task"]), [0, 0])[0] += 1
+            for h, st in t["hosts"].items():
+                c = self.hosts.setdefault(h, [0, 0, 0])
+                c[2 if AnsibleStream.RANK[st] == 3 else 1 if st == "changed" else 0] += st != "skipping"
+            self.task, self.cur = None, 0
+
+    def remaining(self, now):
+        if not self.total: return None
+        return sum(self.left.values()) + (max(0, self.cur - (now - self.t0)) if self.task else 0)
+
+    def fraction(self, now=None):
+        left = self.remaining(now or time.time())
+        return None if left is None else min(0.99, 1 - left/self.total)
+
+    def lines(self, now):
+        task = self.task or "..."
+        role = self.role(task)
+        done, n = self.roles.get(role, [0, 0])
+        where = f"{role} {done}/{n}" if n else role
+        left = self.remaining(now)
+        eta = f"ETA {mmss(left)}" if left is not None else f"{self.n} tasks"
+        hosts = "  ".join(f"{h} {o} ok {c} changed" + (f" {f} FAILED" if f else "") for h, (o, c, f) in self.hosts.items())
+        return [f"{where} | {task.split(' : ', 1)[-1]}", f"{eta}  {hosts}" if hosts else eta]
+
+def mmss(secs):
+    return f"{int(secs//60):02d}:{int(secs%60):02d}"
+
+def percentile(xs, q):
+    xs = sorted(xs)
+    return xs[max(0, min(len(xs)-1, math.ceil(len(xs)*q/100)-1))] if xs else None
+
+def load_runs(dir="logs"):
+    """All runs under logs/: JSONL event files, or START/OK/FAIL lines of older text-only logs."""
+    runs = []
+    for txt in sorted(glob.glob(os.path.join(dir, "install_*.txt"))):
+        rid = os.path.basename(txt)[8:-4]
+        run = {"id": rid, "phases": {}, "tasks": {}, "ok": None}
+        ev = txt[:-4] + ".jsonl"
+        if os.path.exists(ev):
+            with open(ev, encoding='utf-8') as f:
+                for l in f:
+                    try: e = json.loads(l)
+                    except ValueError: continue
+                    if e["ev"] == "phase_end" and e.get("ok"): run["phases"][e["phase"]] = e["secs"]
+                    elif e["ev"] == "task": run["tasks"][(e["phase"], e["task"])] = run["tasks"].get((e["phase"], e["task"]), 0) + e["secs"]
+                    elif e["ev"] == "run_end": run["ok"] = e["ok"]
+        else:
+            started = {}
+            with open(txt, encoding='utf-8', errors='replace') as f:
+                for l in f:
+                    m = re.match(r"\[(\d\d):(\d\d):(\d\d)\] (START|OK|FAIL): (.+)", l)
+                    if not m: continue
+                    h, mi, se, kind, name = m.groups()
+                    t = int(h)*3600 + int(mi)*60 + int(se)
+                    name = name.strip()
+                    if kind == "START": started[name] = t
+                    elif name in started:
+                        if kind == "OK": run["phases"][name] = (t - started.pop(name)) % 86400
+                        else: run["ok"] = False
+        runs.append(run)
+    return runs
+
+class RunLog:
+    """The files one run writes: the text log and its .jsonl event file, both created on first write.
+    Text is buffered but reaches the file within a second; markers (flush=True) and events at once."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.f = self.ev = self.timer = None
+
+    def write(self, text, flush=False):
+        with self.lock:
+            if not self.f: self.f = open(self.path, "a", encoding='utf-8', errors='replace')
+            self.f.write(text)
+            if flush: self.f.flush()
+            elif not self.timer:
+                # Even when a long silent task follows these lines
+                self.timer = threading.Timer(1, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self.timer = None
+            if self.f: self.f.flush()
+
+    def event(self, ev, **kw):
+        with self.lock:
+            if not self.ev: self.ev = open(self.path[:-4] + ".jsonl", "a", encoding='utf-8')
+            self.ev.write(json.dumps(dict(t=round(time.time(), 3), ev=ev, **kw)) + "\n")
+            self.ev.flush()
+
+    def close(self):
+        with self.lock:
+            if self.timer: self.timer.cancel(); self.timer = None
+            if self.f: self.f.close(); self.f = None
+            if self.ev: self.ev.close(); self.ev = None
+
+class LogFile:
+    """Random access to one install log: tail by seeking back from the end, follow, and a byte-offset
+    index of the START/OK/FAIL/SKIP markers kept in <log>.idx and extended incrementally as the log grows."""
+    MARK = re.compile(rb"(?m)^\[(\d\d:\d\d:\d\d)\] (START|OK|FAIL|SKIP): ([^\r\n]*)")
+
+    def __init__(self, path):
+        self.path = path
+        self.id = os.path.basename(path)[8:-4]
+
+    def tail(self, n, start=0, end=None, block=65536):
+        """Last n lines of bytes [start, end) without reading the rest of the file."""
+        with open(self.path, "rb") as f:
+            pos = end if end is not None else f.seek(0, 2)
+            buf = b""
+            while pos > start and buf.count(b"\n") <= n:
+                step = min(block, pos - start)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+        lines = buf.decode('utf-8', errors='replace').splitlines()
+        return lines[-n:] if n else lines
+
+    def index(self):
+        """[(offset, time, kind, name)] for every marker line."""
+        idx = {"scanned": 0, "marks": []}
+        try:
+            with open(self.path + ".idx") as f: idx = json.load(f)
+        except (OSError, ValueError): pass
+        size = os.path.getsize(self.path)
+        if size < idx["scanned"]: idx = {"scanned": 0, "marks": []}
+        if size > idx["scanned"]:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                last = mm.rfind(b"\n", idx["scanned"]) + 1
+                for m in self.MARK.finditer(mm, idx["scanned"], last):
+                    idx["marks"].append([m.start(), *(g.decode('utf-8', errors='replace').strip() for g in m.groups())])
+                idx["scanned"] = max(idx["scanned"], last)
+            try:
+                with open(self.path + ".idx", "w") as f: json.dump(idx, f)
+            except OSError: pass
+        return idx["marks"]
+
+    def sections(self):
+        """{phase: [start offset, end offset, status]} from the marker index; unfinished phases run to EOF."""
+        out = {}
+        for off, _, kind, name in self.index():
+            if kind == "START": out[name] = [off, None, "running"]
+            elif kind == "SKIP": out[name] = [off, off, "SKIP"]
+            elif name in out: out[name][1:] = [off, kind]
+        return out
+
+    def line_end(self, off):
+        with open(self.path, "rb") as f:
+            f.seek(off)
+            return off + len(f.readline())
+
+    def follow(self, poll=0.5):
+        """Yield lines appended after the current end of file, forever."""
+        with open(self.path, encoding='utf-8', errors='replace') as f:
+            f.seek(0, 2)
+            partial = ""
+            while True:
+                chunk = f.readline()
+                if not chunk:
+                    time.sleep(poll)
+                    continue
+                partial += chunk
+                if partial.endswith("\n"):
+                    yield partial
+                    partial = ""
+
+class Probe:
+    """Polls one readiness check with jittered exponential backoff until it passes or `timeout` expires.
+    With `stable`, the check must then keep passing (polled every `base` seconds) for that many seconds."""
+    def __init__(self, name, check, timeout=600, base=1, cap=15, stop=None, stable=0):
+        self.name, self.check, self.timeout, self.base, self.cap = name, check, timeout, base, cap
+        self.stop, self.stable = stop or threading.Event(), stable
+        self.tries, self.elapsed, self.error = 0, None, None
+
+    def wait(self):
+        t0 = time.time()
+        delay, up = self.base, None
+        while True:
+            self.tries += 1
+            try: ok = self.check()
+            except Exception as e: ok, self.error = False, e
+            now = time.time()
+            if ok:
+                up = up or now
+                if now - up >= self.stable:
+                    self.elapsed = now - t0
+                    return True
+                delay = self.base
+            else: up = None
+            left = t0 + self.timeout - now
+            if left <= 0: return False
+            if self.stop.wait(min(left, delay/2 + random.uniform(0, delay/2))): return False
+            if not ok: delay = min(self.cap, delay*2)
+
+    @staticmethod
+    def tcp(host, port, t=2):
+        def check():
+            with socket.create_connection((host, port), timeout=t): return True
+        return check
+
+    @staticmethod
+    def http(url, ok=lambda code, body: code < 500, data=None, t=3):
+        import urllib.request, urllib.error   # deferred with asyncio: together ~60 ms of menu startup
+        def check():
+            req = urllib.request.Request(url, data=json.dumps(data).encode() if data else None,
+                                         headers={"Content-Type": "application/json-rpc"})
+            try:
+                with urllib.request.urlopen(req, timeout=t) as r: return ok(r.status, r.read(4096))
+            except urllib.error.HTTPError as e: return ok(e.code, b"")
+        return check
+
+def wait_ready(probes):
+    """Runs all probes concurrently; returns {name: seconds to ready, or None on timeout}."""
+    if not probes: return {}
+    with pool(len(probes)) as ex:
+        results = list(ex.map(lambda p: p.wait(), probes))
+    return {p.name: p.elapsed if r else None for p, r in zip(probes, results)}
+
+class LoadGen:
+    """asyncio HTTP/1.1 load over `conns` keep-alive connections. Every request is recorded as
+    (start, latency, ok) on the monotonic clock; a failed connection is reopened after a short pause."""
+    def __init__(self, host, port=80, path="/", conns=50, timeout=2):
+        self.host, self.port, self.conns, self.timeout = host, port, conns, timeout
+        self.req = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode()
+        self.samples = []
+
+    async def _response(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        m = re.search(rb"(?i)\r\ncontent-length:\s*(\d+)", head)
+        if m: await reader.readexactly(int(m.group(1)))
+        else: raise ValueError("no content-length")   # can't reuse the connection
+        if status >= 500: raise ValueError(f"HTTP {status}")
+
+    async def _worker(self, stop):
+        import asyncio
+        reader = writer = None
+        while not stop.is_set():
+            t0 = time.monotonic()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                writer.write(self.req)
+                await asyncio.wait_for(self._response(reader), self.timeout)
+                self.samples.append((t0, time.monotonic() - t0, True))
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, IndexError):
+                self.samples.append((t0, time.monotonic() - t0, False))
+                if writer: writer.close()
+                reader = writer = None
+                await asyncio.sleep(0.05)
+        if writer: writer.close()
+
+    async def run(self, seconds, actions=()):
+        """Run load for `seconds`; `actions` are (delay, blocking fn) run in a thread at that offset.
+        Returns {fn name: (start, end)} on the same clock as the samples."""
+        import asyncio
+        stop, marks = asyncio.Event(), {}
+        loop = asyncio.get_running_loop()
+        workers = [asyncio.create_task(self._worker(stop)) for _ in range(self.conns)]
+        t0 = time.monotonic()
+        async def act(delay, fn):
+            await asyncio.sleep(delay)
+            start = time.monotonic()
+            await loop.run_in_executor(None, fn)
+            marks[fn.__name__] = (start, time.monotonic())
+        try: await asyncio.gather(*(act(d, fn) for d, fn in actions), asyncio.sleep(seconds))
+        finally:
+            # Also when an action raised: the workers only end through `stop`
+            stop.set()
+            await asyncio.gather(*workers)
+        marks["load"] = (t0, time.monotonic())
+        return marks
+
+def failover_report(samples, trigger, settled, end):
+    """Time-to-first-failure, outage and latency/throughput before, during and after the move.
+    `during` runs from the trigger until service is restored or the standby command returned, whichever is later."""
+    fails = [t for t, _, ok in samples if not ok and t >= trigger]
+    first = min(fails) if fails else None
+    last = max(fails) if fails else None
+    restored = min((t + lat for t, lat, ok in samples if ok and last is not None and t >= last), default=None)
+    move_end = max(restored or trigger, settled)
+    begin = min((t for t, _, _ in samples), default=trigger)
+    def window(a, b):
+        xs = [(lat, ok) for t, lat, ok in samples if a <= t < b]
+        lat = [l*1000 for l, ok in xs if ok]
+        return {"secs": round(b - a, 3), "requests": len(xs), "errors": sum(1 for _, ok in xs if not ok),
+                "rps": round(len(lat) / (b - a), 1) if b > a else 0,
+                **{f"p{q}_ms": round(percentile(lat, q), 2) if lat else None for q in (50, 99, 99.9)}}
+    return {
+        "time_to_first_failure": round(first - trigger, 3) if first else None,
+        "outage": round(restored - first, 3) if first and restored else (round(end - first, 3) if first else 0),
+        "failed_requests": len(fails),
+        "before": window(begin, trigger), "during": window(trigger, move_end), "after": window(move_end, end),
+    }
+
+class ClusterWatch:
+    """Incremental parser for a stream of `crm_mon` XML documents (CMD prints one a second over a single
+    ssh session). Each document is parsed when its end marker arrives; resource state changes go on a
+    timeline with how long each resource took to (re)start. `done` once every resource of the group is
+    Started, not failed, on the same node (unless `follow`)."""
+    END = "==cerberus=="
+    CMD = f"sudo sh -c 'while :; do crm_mon -1 --output-as=xml 2>/dev/null || crm_mon -1 --as-xml; echo {END}; sleep 1; done'"
+
+    def __init__(self, group="ha-services", resources=("cluster-vip", "webserver", "samba"), follow=False, on_change=None):
+        self.group, self.resources, self.follow, self.on_change = group, resources, follow, on_change
+        self.t0, self.buf, self.polls = time.monotonic(), [], 0
+        self.state, self.groups, self.nodes = {}, {}, {}
+        self.timeline, self.pending, self.latency = [], {}, {}
+        self.converged_at, self.done = None, False
+
+    @staticmethod
+    def parse(doc):
+        """({resource: (role, node, failed)}, {group: [members]}, {node: online}); both XML formats."""
+        import xml.etree.ElementTree as ET
+        root = ET.fromstring(doc)
+        res = {}
+        for r in root.iter("resource"):
+            on = r.find("node")
+            res[r.get("id")] = (r.get("role"), on.get("name") if on is not None else None, r.get("failed") == "true")
+        groups = {g.get("id"): [r.get("id") for r in g.iter("resource")] for g in root.iter("group")}
+        nodes = {n.get("name"): n.get("online") == "true" for n in root.iter("node") if n.get("online") is not None}
+        return res, groups, nodes
+
+    def feed(self, line):
+        if line.strip() != self.END: self.buf.append(line); return
+        doc, self.buf = "".join(self.buf), []
+        try: res, self.groups, self.nodes = self.parse(doc[doc.find("<"):])
+        except Exception: return     # not XML (cluster not up yet, crm_mon error): try the next poll
+        self.polls += 1
+        t = time.monotonic() - self.t0
+        for name in sorted(set(res) | set(self.state)):
+            old, new = self.state.get(name), res.get(name, ("Absent", None, False))
+            if new == old: continue
+            self.state[name] = new
+            lat = None
+            if new[0] == "Started" and not new[2]:
+                if name in self.pending: lat = self.latency[name] = t - self.pending.pop(name)
+            else: self.pending.setdefault(name, t if old else 0.0)    # not started when the watch began: count from 0
+            self.timeline.append({"at": round(t, 2), "resource": name, "from": old[0] if old else None, "to": new[0],
+                                  "node": new[1], "failed": new[2], "latency": round(lat, 2) if lat is not None else None})
+            if self.on_change: self.on_change(self.timeline[-1])
+        if self.converged():
+            if self.converged_at is None: self.converged_at = t
+            if not self.follow: self.done = True
+        else: self.converged_at = None
+
+    def converged(self):
+        members = self.groups.get(self.group, [])
+        st = [self.state.get(r) for r in self.resources]
+        return all(r in members for r in self.resources) and all(s and s[0] == "Started" and not s[2] for s in st) \
+            and len({s[1] for s in st}) == 1
+
+    def node(self):
+        return self.state.get(self.resources[0], (None, None))[1]
+
+    def close(self):
+        pass
+
+class SSHPool:
+    """Runs commands on lab VMs with plain ssh: `vagrant ssh-config` is resolved once per VM and every
+    command rides one persistent ControlMaster connection per VM. Falls back to `vagrant ssh` where
+    plain ssh can't be used (no ssh client, or WSL with Windows-side key paths)."""
+    def __init__(self, vagrant, enabled=True, dir=".vagrant/cerberus", env=None):
+        self.vagrant, self.dir, self.env = vagrant, dir, env
+        self.enabled = enabled and bool(shutil.which("ssh"))
+        self.mux = sys.platform != "win32"
+        self.cfgs = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, *vms):
+        """One `vagrant ssh-config` call for all VMs not resolved yet."""
+        with self.lock:
+            todo = [vm for vm in vms if vm not in self.cfgs]
+            if not todo or not self.enabled: return
+            out = subprocess.run(f"{self.vagrant} ssh-config {' '.join(todo)}", shell=True, capture_output=True,
+                                 text=True, encoding='utf-8', errors='replace', env=self.env)
+            if out.returncode != 0: raise Exception(f"vagrant ssh-config {' '.join(todo)} failed: {out.stderr.strip()}")
+            os.makedirs(self.dir, exist_ok=True)
+            for block in re.split(r"(?m)^(?=Host )", out.stdout):
+                m = re.match(r"Host (\S+)", block)
+                if not m: continue
+                path = os.path.join(self.dir, f"ssh-{m.group(1)}.conf")
+                with open(path, "w") as f: f.write(block)
+                self.cfgs[m.group(1)] = path
+
+    def cmd(self, vm, command=None, tty=False):
+        if not self.enabled:
+            return f'{self.vagrant} ssh {vm}' + (f' -c "{command}"' if command else "")
+        self.resolve(vm)
+        opts = f"-F {self.cfgs[vm]}"
+        if self.mux:
+            ctl = os.path.join(tempfile.gettempdir(), "cerberus-%C")
+            opts += f" -o ControlMaster=auto -o ControlPath={ctl} -o ControlPersist=10m"
+        if tty: opts += " -t"
+        return f'ssh {opts} {vm}' + (f' "{command}"' if command else "")
+
+    def close(self):
+        """Drop master connections and cached configs (ports change when VMs are recreated)."""
+        with self.lock:
+            if self.enabled and self.mux:
+                for vm, cfg in self.cfgs.items():
+                    ctl = os.path.join(tempfile.gettempdir(), "cerberus-%C")
+                    subprocess.run(f"ssh -F {cfg} -o ControlPath={ctl} -O exit {vm}", shell=True, capture_output=True)
+            self.cfgs.clear()
+
+class VMStatus:
+    """Per-VM state from `vagrant status --machine-readable`, cached in `path` for `ttl` seconds so the menu
+    never waits on vagrant's startup. Stale reads return the cached states and refresh in the background;
+    `fast` (a hypervisor query such as VBoxManage/vmrun, returning the set of running VMs) runs alongside
+    and fills in running/not running before the authoritative vagrant answer lands."""
+    CHANGES = ("up", "halt", "destroy", "reload", "resume", "suspend", "snapshot")
+    def __init__(self, vagrant, vms, path, env=None, fast=None, ttl=15):
+        self.vagrant, self.vms, self.path, self.env, self.fast, self.ttl = vagrant, vms, path, env, fast, ttl
+        self.lock = threading.Lock()
+        self.thread = None
+        self.error = None
+        try:
+            with open(path) as f: self.data = json.load(f)
+        except (OSError, ValueError): self.data = {"t": 0, "vms": {}}
+
+    def age(self):
+        return time.time() - self.data["t"]
+
+    def expired(self):
+        return self.data.get("stale") or self.age() >= self.ttl
+
+    def get(self, wait=False):
+        """{vm: state}, possibly stale; `wait` blocks for a refresh when the cache has expired."""
+        if self.expired(): self.refresh()
+        if wait and self.thread: self.thread.join(35)
+        return dict(self.data["vms"])
+
+    def refresh(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive(): return
+            self.thread = threading.Thread(target=self._refresh, daemon=True)
+            self.thread.start()
+
+    def invalidate(self):
+        """Mark stale, on disk too, so other processes (or the next run) don't trust the old states."""
+        self._set({}, self.data["t"], stale=True)
+
+    def _refresh(self):
+        try:
+            with pool(1) as ex:
+                slow = ex.submit(self._vagrant)
+                if self.fast:
+                    try: running = self.fast()
+                    except (OSError, subprocess.SubprocessError): running = None
+                    if running is not None:
+                        old = self.data["vms"]
+                        self._set({vm: "running" if vm in running else old.get(vm) if old.get(vm) not in (None, "running") else "not running"
+                                   for vm in self.vms}, self.data["t"], stale=True)
+                self._set(slow.result(), time.time())
+            self.error = None
+        except Exception as e: self.error = str(e)
+
+    def _vagrant(self):
+        out = subprocess.run(f"{self.vagrant} status --machine-readable", shell=True, capture_output=True, timeout=30,
+                             text=True, encoding='utf-8', errors='replace', env=self.env)
+        # timestamp,target,type,data: one "state" line per machine (running, poweroff, saved, not_created, ...)
+        states = {f[1]: f[3] for f in (l.split(",", 3) for l in out.stdout.splitlines()) if len(f) == 4 and f[2] == "state" and f[1] in self.vms}
+        if not states: raise Exception(f"vagrant status exit {out.returncode}: {out.stderr.strip()[-200:]}")
+        return states
+
+    def _set(self, vms, t, stale=False):
+        self.data = {"t": t, "vms": dict(self.data["vms"], **vms), "stale": stale}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".tmp", "w") as f: json.dump(self.data, f)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError: pass
+
+    @staticmethod
+    def summary(vms, all_vms):
+        """'running', 'stopped', 'not created', or e.g. 'partial: 3/4 running' for a mixed lab."""
+        states = [vms.get(vm) for vm in all_vms]
+        if None in states: return "unknown"
+        if all(s == "running" for s in states): return "running"
+        if all(s == "not_created" for s in states): return "not created"
+        up = sum(s == "running" for s in states)
+        return f"partial: {up}/{len(states)} running" if up else "stopped"
+
+class Job:
+    """A long operation running in its own thread. Output from the thread (and pools it starts)
+    lands in a bounded buffer; `cancel` stops its child processes."""
+    def __init__(self, id, name, fn):
+        self.id, self.name, self.fn = id, name, fn
+        self.out = deque(maxlen=5000)
+        self.state, self.t0, self.t1 = "running", time.time(), None
+        self.cancelled = threading.Event()
+        self.procs = set()
+        self.attached = None
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._main, name=f"job-{id}", daemon=True)
+
+    def _main(self):
+        try: ok = self.fn()
+        except Exception as e: print(f"{ERR} {e}"); ok = False
+        self.state = "cancelled" if self.cancelled.is_set() else "failed" if ok is False else "done"
+        self.t1 = time.time()
+
+    def write(self, text):
+        with self.lock:
+            self.out.append(text)
+            if self.attached:
+                self.attached.write(text)
+                self.attached.flush()
+
+    def text(self):
+        with self.lock: return "".join(self.out)
+
+    def last_line(self):
+        lines = self.text().strip().splitlines()
+        return re.sub(r"\x1b\[[0-9;]*[A-Za-z]", "", lines[-1]) if lines else ""
+
+    def kill(self, grace=10):
+        for proc in list(self.procs):
+            if proc.poll() is not None: continue
+            try:
+                if os.name == "nt": subprocess.run(f"taskkill /T /F /PID {proc.pid}", shell=True, capture_output=True)
+                else: os.killpg(proc.pid, signal.SIGTERM)
+            except OSError: pass
+        def force():
+            for proc in list(self.procs):
+                if proc.poll() is None and os.name != "nt":
+                    try: os.killpg(proc.pid, signal.SIGKILL)
+                    except OSError: pass
+        t = threading.Timer(grace, force)
+        t.daemon = True
+        t.start()
+
+class Jobs:
+    """Background jobs for the menu, plus a sys.stdout stand-in that routes each job's output to its buffer."""
     def __init__(self):
+        self.jobs = {}
+        self.real = None
+        self.notified = set()
+
+    def install(self):
+        if not self.real:
+            self.real = sys.stdout
+            sys.stdout = self
+
+    def current(self):
+        name = threading.current_thread().name
+        if name.startswith("job-"): return self.jobs.get(int(name.split("/")[0][4:]))
+
+    def running(self):
+        return [j for j in self.jobs.values() if j.state == "running"]
+
+    def submit(self, name, fn):
+        job = Job(len(self.jobs) + 1, name, fn)
+        self.jobs[job.id] = job
+        job.thread.start()
+        return job
+
+    def notices(self):
+        out = []
+        for j in self.jobs.values():
+            if j.state != "running" and j.id not in self.notified:
+                self.notified.add(j.id)
+                out.append(j)
+        return out
+
+    # file protocol for sys.stdout
+    def write(self, text):
+        job = self.current()
+        return job.write(text) if job else self.real.write(text)
+    def flush(self):
+        self.real.flush()
+    def isatty(self):
+        return False if self.current() else self.real.isatty()
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+# vm: (default MB, default vCPUs, minimum MB) - the defaults are what the Vagrantfile uses without a profile
+VM_SIZES = {"admin": (2048, 2, 1536), "node01": (1024, 1, 768), "node02": (1024, 1, 768), "winsrv": (2048, 2, 2048)}
+HOST_RESERVE = 2048     # MB left to the host OS
+DISK_NEEDED = 40        # GB for boxes and VM disks
+
+def host_resources(path=".", wsl=False, disk_test=False):
+    """RAM total/available (MB), logical cores, free disk at `path` (GB) and, with `disk_test`,
+    sequential write throughput there (MB/s). Under WSL the VMs run on Windows, so its memory counts."""
+    total = avail = None
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong)] + \
+                           [(n, ctypes.c_ulonglong) for n in ("total", "avail", "pf", "pfa", "virt", "virta", "ext")]
+            ms = MEMORYSTATUSEX(dwLength=ctypes.sizeof(MEMORYSTATUSEX))
+            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(ms))
+            total, avail = ms.total >> 20, ms.avail >> 20
+        elif wsl and shutil.which("powershell.exe"):
+            out = subprocess.run(["powershell.exe", "-NoProfile", "-Command",
+                                  "$o = Get-CimInstance Win32_OperatingSystem; $o.TotalVisibleMemorySize; $o.FreePhysicalMemory"],
+                                 capture_output=True, text=True, timeout=20).stdout.split()
+            total, avail = int(out[0]) >> 10, int(out[1]) >> 10
+        elif os.path.exists("/proc/meminfo"):
+            with open("/proc/meminfo") as f: mi = {l.split(":")[0]: int(l.split()[1]) for l in f}
+            total, avail = mi["MemTotal"] >> 10, mi.get("MemAvailable", mi["MemFree"]) >> 10
+        elif sys.platform == "darwin":
+            total = int(subprocess.run(["sysctl", "-n", "hw.memsize"], capture_output=True, text=True).stdout) >> 20
+    except (OSError, ValueError, IndexError, KeyError, subprocess.SubprocessError): pass
+    res = {"mem_total": total, "mem_avail": avail, "cores": os.cpu_count() or 1,
+           "disk_free": shutil.disk_usage(path).free >> 30, "disk_mbps": None}
+    if disk_test:
+        buf, mb = os.urandom(4 << 20), 256
+        with tempfile.NamedTemporaryFile(dir=path) as f:
+            t0 = time.time()
+            for _ in range(mb // 4): f.write(buf)
+            f.flush(); os.fsync(f.fileno())
+            res["disk_mbps"] = round(mb / max(time.time() - t0, 1e-3))
+    return res
+
+def size_profile(res):
+    """Memory/vCPUs per VM scaled to what the host can spare, and how many VMs to boot at once."""
+    default = sum(m for m, _, _ in VM_SIZES.values())
+    budget = (res["mem_avail"] or res["mem_total"] or default + HOST_RESERVE) - HOST_RESERVE
+    f = max(0.5, min(2.0, budget / default))
+    cores = res["cores"]
+    vms = {vm: {"memory": max(low, int(mem*f) // 256 * 256), "cpus": cpus*2 if cores >= 12 else cpus if cores >= 4 else 1}
+           for vm, (mem, cpus, low) in VM_SIZES.items()}
+    # Booting is disk and CPU bound; when memory is already short, one at a time avoids a swap storm
+    par = min(4, max(1, cores // 2), max(1, res["disk_mbps"] // 100) if res["disk_mbps"] else 4)
+    if sum(v["memory"] for v in vms.values()) > budget: par = 1
+    return {"at": datetime.now().isoformat(timespec="seconds"), "host": res, "vms": vms, "parallel": par}
+
+def overcommit(profile, res):
+    """Warnings for a profile that doesn't fit the host as it is now."""
+    need = sum(v["memory"] for v in profile["vms"].values())
+    cpus = sum(v["cpus"] for v in profile["vms"].values())
+    out = []
+    if res["mem_total"] and need > res["mem_total"] - HOST_RESERVE:
+        out.append(f"VMs need {need} MB but the host has {res['mem_total']} MB: expect heavy swapping")
+    elif res["mem_avail"] and need > res["mem_avail"] - HOST_RESERVE:
+        out.append(f"VMs need {need} MB, {res['mem_avail']} MB free (fine if the lab is already running)")
+    if cpus > res["cores"]: out.append(f"{cpus} vCPUs on {res['cores']} cores")
+    if res["disk_free"] < DISK_NEEDED: out.append(f"{res['disk_free']} GB free disk, the lab needs ~{DISK_NEEDED} GB")
+    return out
+
+class Instance:
+    """One isolated lab: its own host-only subnet, block of forwarded ports, VM name prefix, vagrant
+    machine directory, state and logs. Instance 0 is the classic lab (192.168.56.x, 8080/8443/53389,
+    CERBERUS-*); N gets 192.168.(56+N).x, ports +100*N (RDP +N) and CERBERUS<N>-*. VirtualBox only
+    allows host-only networks in 192.168.56.0/21 by default, hence at most 8 instances."""
+    HOSTS = {"admin": 10, "node01": 21, "node02": 22, "winsrv": 30, "vip": 100}
+    TITLES = {"admin": "Admin", "node01": "Node01", "node02": "Node02", "winsrv": "WinSrv"}
+    MAX = 7
+
+    def __init__(self, n=0):
+        if not 0 <= n <= self.MAX: raise ValueError(f"instance must be 0-{self.MAX}")
+        self.n = n
+        self.name = f"lab{n}" if n else "default"
+        self.subnet = f"192.168.{56 + n}"
+        self.prefix = f"CERBERUS{n}" if n else "CERBERUS"
+        self.ports = {"http": 8080 + 100*n, "https": 8443 + 100*n, "node01": 8081 + 100*n, "node02": 8082 + 100*n, "rdp": 53389 + n}
+        self.dir = os.path.join(".vagrant", "instances", self.name) if n else None
+        self.var = self.dir or "."
+        self.logdir = os.path.join("logs", self.name) if n else "logs"
+
+    def ip(self, host):
+        return f"{self.subnet}.{self.HOSTS[host]}"
+
+    def vm_name(self, vm):
+        """Hypervisor-side VM name (vb.name / displayName in the Vagrantfile)."""
+        return f"{self.prefix}-{self.TITLES[vm]}"
+
+    def endpoints(self):
+        return {"ssh:admin": (self.ip("admin"), 22), "ssh:node01": (self.ip("node01"), 22), "ssh:node02": (self.ip("node02"), 22),
+                "winrm:winsrv": (self.ip("winsrv"), 5985), "zabbix-api": (self.ip("admin"), 80), "vip": (self.ip("vip"), 80)}
+
+    def env(self):
+        """Environment for child processes: this instance's vagrant machine directory and the settings the
+        Vagrantfile reads (and none inherited from a parent running another instance)."""
+        env = {k: v for k, v in os.environ.items() if k not in ("VAGRANT_DOTFILE_PATH", "CERBERUS_INSTANCE_FILE", "CERBERUS_SIM_DIR")}
+        if self.n:
+            d = os.path.abspath(self.dir)
+            env.update(VAGRANT_DOTFILE_PATH=os.path.join(d, "vagrant"), CERBERUS_INSTANCE_FILE=os.path.join(d, "instance.json"))
+        return env
+
+    def ansible_args(self):
+        """Inventory for ansible-playbook on admin: the rendered copy is synced to /home/vagrant/instance."""
+        if not self.n: return "-i inventory/hosts"
+        return "-i /home/vagrant/instance/hosts -e @/home/vagrant/instance/vars.yml"
+
+    def render(self):
+        """instance.json for the Vagrantfile, plus the inventory and the network vars (as extra vars,
+        so they win over group_vars/all.yml) with this instance's subnet."""
+        if not self.n: return
+        os.makedirs(self.dir, exist_ok=True)
+        files = {"instance.json": json.dumps({"name": self.name, "subnet": self.subnet, "prefix": self.prefix,
+                                              "ports": self.ports, "dir": os.path.abspath(self.dir)}, indent=1) + "\n"}
+        with open("ansible/inventory/hosts", newline="") as f:
+            files["hosts"] = f.read().replace("192.168.56.", self.subnet + ".")
+        files["vars.yml"] = f'network_prefix: "{self.subnet}"\nvip_address: "{self.ip("vip")}"\nzabbix_server_ip: "{self.ip("admin")}"\n'
+        for name, text in files.items():
+            path = os.path.join(self.dir, name)
+            if not os.path.exists(path) or open(path, newline="").read() != text:
+                with open(path, "w", newline="") as f: f.write(text)
+
+    @classmethod
+    def existing(cls):
+        found = [int(d[3:]) for d in os.listdir(os.path.join(".vagrant", "instances")) if re.fullmatch(r"lab\d+", d)] \
+            if os.path.isdir(os.path.join(".vagrant", "instances")) else []
+        return [cls(0)] + [cls(n) for n in sorted(found) if 0 < n <= cls.MAX]
+
+    @staticmethod
+    def parse(args):
+        """'1 2 5' or '1-3' -> [1, 2, 3]."""
+        out = []
+        for a in args:
+            lo, _, hi = a.partition("-")
+            out += range(int(lo), int(hi or lo) + 1)
+        return list(dict.fromkeys(out))
+
+class Lab:
+    VMS = ("admin", "node01", "node02", "winsrv")
+
+    def __init__(self, instance=0):
         self.dir = os.path.dirname(os.path.abspath(__file__))
         os.chdir(self.dir)
         self.os = self._detect_os()
-        self.vagrant = "vagrant.exe" if self.os == "wsl" and shutil.which("vagrant.exe") else "vagrant"
+        self.inst = Instance(instance)
         self.provider = self._load_cfg()
-        self.log = None
+        self.ssh = self.sim = None
+        self._backend()
+        self.jobs = Jobs()
+        self._logs = {}     # job id (None: the menu/CLI itself) -> RunLog
         self.verbose = False
+        self.workers = 2
+        self.pb, self.lanes = None, {}
+        self.ready = {}
 
     def _detect_os(self):
         if sys.platform == "win32": return "windows"
@@ -69,57 +1054,345 @@ class Lab:
     def _save_cfg(self, p):
         with open(".cerberus_config", "w") as f: f.write(f"PROVIDER={p}\n")
         self.provider = p
+        self._backend()
+
+    def _backend(self):
+        """Real vagrant, or the simulated one in simlab.py (PROVIDER=sim): fake vagrant CLI, local stand-in
+        endpoints, and checkpoints/snapshots/logs kept apart from the real lab's."""
+        if self.ssh: self.ssh.close()
+        if self.sim: self.sim.close(); self.sim = None
+        self.inst.render()
+        self.vagrant = "vagrant.exe" if self.os == "wsl" and shutil.which("vagrant.exe") else "vagrant"
+        self.env = self.inst.env()
+        self.endpoints = self.inst.endpoints()
+        self.var, self.logdir = self._dirs(self.inst)
+        self.vms = self._vm_status(self.inst)
+        ssh_dir = os.path.join(self.inst.dir, "ssh") if self.inst.dir else ".vagrant/cerberus"
+        self.ssh = SSHPool(self.vagrant, enabled=self.os != "wsl", dir=ssh_dir, env=self.env)
+        if self.provider == "sim":
+            import simlab
+            self.env["CERBERUS_SIM_DIR"] = self.var
+            self.sim = simlab.Endpoints(dir=self.var).start()
+            self.endpoints = self.sim.endpoints
+            self.vagrant = f'"{sys.executable}" simlab.py vagrant'
+            self.ssh = SSHPool(self.vagrant, enabled=False, env=self.env)
+
+    def _dirs(self, inst):
+        """(state dir, log dir) of an instance; the simulated backend keeps its own."""
+        if self.provider != "sim": return inst.var, inst.logdir
+        import simlab
+        if not inst.n: return simlab.ROOT, os.path.join("logs", "sim")
+        return os.path.join(simlab.ROOT, inst.name), os.path.join("logs", "sim", inst.name)
+
+    def _vm_status(self, inst):
+        """Cached per-VM state of an instance (its own vagrant machine dir, or sim state dir)."""
+        env, var = inst.env(), self._dirs(inst)[0]
+        if self.provider == "sim":
+            env["CERBERUS_SIM_DIR"] = var
+            return VMStatus(f'"{sys.executable}" simlab.py vagrant', self.VMS, os.path.join(var, ".cerberus_status"), env)
+        vagrant = "vagrant.exe" if self.os == "wsl" and shutil.which("vagrant.exe") else "vagrant"
+        return VMStatus(vagrant, self.VMS, os.path.join(var, ".cerberus_status"), env, lambda: self._running_vms(inst, env))
+
+    def _running_vms(self, inst, env):
+        """Names of this instance's running VMs straight from the hypervisor, without vagrant's startup.
+        None where that isn't possible (WSL, hypervisor CLI not on PATH)."""
+        if self.os == "wsl": return None
+        if self.provider == "virtualbox":
+            out = subprocess.run(["VBoxManage", "list", "runningvms"], capture_output=True, text=True, timeout=5).stdout
+            names = set(re.findall(r'^"(.*)" \{', out, re.M))
+            return {vm for vm in self.VMS if inst.vm_name(vm) in names}
+        if self.provider == "vmware_desktop":
+            out = subprocess.run(["vmrun", "list"], capture_output=True, text=True, timeout=5).stdout
+            dot = os.path.normcase(os.path.abspath(env.get("VAGRANT_DOTFILE_PATH", ".vagrant")))
+            paths = [os.path.normcase(l.strip()) for l in out.splitlines()[1:]]
+            return {vm for vm in self.VMS if any(p.startswith(os.path.join(dot, "machines", vm) + os.sep) for p in paths)}
+        return None
+
+    def _file(self, name):
+        return os.path.join(self.var, name)
+
+    def _run_log(self):
+        """The run log of the calling context: a background job's own, or the foreground one. A `cluster
+        watch` typed while a job deploys must not write into that job's log."""
+        job = self.jobs.current()
+        return self._logs.get(job.id if job else None)
+
+    @property
+    def log(self):
+        l = self._run_log()
+        return l.path if l else None
+
+    def _open_log(self, path):
+        """Set the run log; it and its .jsonl event file are created on first write."""
+        job = self.jobs.current()
+        self._logs[job.id if job else None] = RunLog(path)
+
+    def _close_log(self):
+        job = self.jobs.current()
+        l = self._logs.pop(job.id if job else None, None)
+        if l: l.close()
+
+    def _write(self, text, flush=False):
+        l = self._run_log()
+        if l: l.write(text, flush)
+
+    def _event(self, ev, **kw):
+        """Structured run event, one JSON object per line in logs/install_<ts>.jsonl."""
+        l = self._run_log()
+        if l: l.event(ev, **kw)
 
     def _log(self, msg):
-        if self.log:
-            with open(self.log, "a", encoding='utf-8') as f: f.write(f"[{datetime.now():%H:%M:%S}] {msg}\n")
+        self._write(f"[{datetime.now():%H:%M:%S}] {msg}\n", flush=True)
 
-    def _run(self, cmd, name=None, check=True, silent=False):
+    def _run(self, cmd, name=None, check=True, silent=False, spill=None, tail=200, timeout=None, log=True, parser=None, cancellable=True):
+        """Run a shell command, streaming its output. Returns (rc, last `tail` lines); use `spill` for the full text.
+        A `parser` sees every line and can end the command early by setting `done`. With `cancellable=False` the
+        command runs (and is not killed) even when its job is cancelled: cleanup that must happen regardless."""
+        job = self.jobs.current()
+        watch = job if cancellable else None
+        if watch and watch.cancelled.is_set(): raise Exception("cancelled")
         if name: self._log(f"START: {name}")
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-                                text=True, encoding='utf-8', errors='replace')
-        out = ""
-        for line in proc.stdout:
-            out += line
-            if self.verbose and not silent: 
-                try:
-                    sys.stdout.write(line)
-                except:
-                    pass
-            if self.log:
-                with open(self.log, "a", encoding='utf-8', errors='replace') as f: f.write(line)
-        rc = proc.wait()
+        # Background jobs get their own process group: Ctrl+C in the menu must not reach them, and cancel kills the whole tree
+        group = {} if not job else {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else {"start_new_session": True}
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=self.env,
+                                text=True, encoding='utf-8', errors='replace', **group)
+        if watch: watch.procs.add(proc)
+        timer = threading.Timer(timeout, proc.kill) if timeout else None
+        if timer: timer.start()
+        if not parser and log and "ansible-playbook" in cmd:
+            view = self._playbook_view(name)
+            def task(t):
+                self._event("task", **t)
+                if view: view.finish(t)
+            parser = AnsibleStream(name, task, on_start=view and view.start)
+        cap = Capture(self._write if log else None, tail, spill, echo=self.verbose and not silent, parser=parser)
+        try:
+            cap.pump(proc.stdout)
+            if parser and parser.done: proc.kill()
+            rc = proc.wait()
+        finally:
+            if timer: timer.cancel()
+            if watch: watch.procs.discard(proc)
+            cap.close()
+        if watch and watch.cancelled.is_set():
+            if name: self._log(f"FAIL: {name} (cancelled)")
+            raise Exception("cancelled")
         if name: self._log(f"{'OK' if rc==0 else 'FAIL'}: {name}")
+        if cmd.startswith(self.vagrant) and cmd[len(self.vagrant):].split()[:1] in [[c] for c in VMStatus.CHANGES]: self.vms.invalidate()
         if rc != 0 and check: raise Exception(f"{name or cmd} failed (exit {rc})")
-        return rc, out
-
-    def _wait_winrm(self, ip="192.168.56.30", retries=60):
-        self._log("Waiting for WinRM...")
-        chk = f"import socket; s=socket.socket(); s.settimeout(2); exit(0 if s.connect_ex(('{ip}',5985))==0 else 1)"
-        for i in range(retries):
-            if subprocess.run(f'{self.vagrant} ssh admin -c "python3 -c \\"{chk}\\""', shell=True, capture_output=True).returncode == 0:
-                self._log(f"WinRM OK after {i+1} tries")
-                return True
-            time.sleep(10)
-        return False
+        return rc, cap.text()
+
+    def _playbook_view(self, name):
+        """Live task view on the progress bar lane of the phase running this playbook, if it is shown."""
+        lane = self.lanes.get(name)
+        if not (self.pb and self.pb.live and lane): return None
+        view = PlaybookProgress(self.pb, name, load_runs(self.logdir))
+        self.pb.view(lane, view)
+        return view
+
+    def _ssh(self, vm, cmd, name=None, check=True, silent=True, cancellable=True, timeout=None):
+        return self._run(self.ssh.cmd(vm, cmd), name, check=check, silent=silent, cancellable=cancellable, timeout=timeout)
+
+    def _probes(self, timeout=600):
+        zbx = {"jsonrpc": "2.0", "method": "apiinfo.version", "params": {}, "id": 1}
+        url = lambda n, path="/": "http://%s:%d%s" % (*self.endpoints[n], path)
+        checks = {n: Probe.tcp(*self.endpoints[n]) for n in ("ssh:admin", "ssh:node01", "ssh:node02")}
+        checks["winrm:winsrv"] = Probe.http(url("winrm:winsrv", "/wsman"))
+        checks["zabbix-api"] = Probe.http(url("zabbix-api", "/api_jsonrpc.php"), lambda c, b: c == 200 and b'"result"' in b, zbx)
+        checks["vip"] = Probe.http(url("vip"), lambda c, b: c == 200)
+        return {n: Probe(n, check, timeout) for n, check in checks.items()}
+
+    def _wait_ready(self, names, timeout=600, stable=None):
+        """Block until every named target answers (for `stable[name]` seconds in a row, if given); logs and
+        records how long each took."""
+        probes = [self._probes(timeout)[n] for n in names]
+        for p in probes: p.stable = (stable or {}).get(p.name, 0)
+        job = self.jobs.current()
+        if job:
+            for p in probes: p.stop = job.cancelled
+        self._log(f"Waiting for {', '.join(names)}...")
+        res = wait_ready(probes)
+        for p in probes:
+            self.ready[p.name] = res[p.name]
+            if res[p.name] is None: self._log(f"NOT READY: {p.name} after {p.tries} tries ({p.error})")
+            else: self._log(f"READY: {p.name} after {res[p.name]:.1f}s ({p.tries} tries)")
+            self._event("ready", target=p.name, secs=res[p.name] and round(res[p.name], 2), tries=p.tries)
+        missing = [n for n, t in res.items() if t is None]
+        if missing: raise Exception(f"Not ready: {', '.join(missing)}")
+        return res
+
+    def _wait_winrm(self, timeout=600):
+        # scripts/fix_ip.ps1 resets the adapter 10s after `vagrant up winsrv` returns: WinRM answering
+        # once proves nothing, it has to stay up past that (the simulated VM has no such script)
+        try: self._wait_ready(["winrm:winsrv"], timeout, stable={"winrm:winsrv": 0 if self.sim else 20}); return True
+        except Exception: return False
 
     def check(self):
         print(f"\n{INFO} Checking prerequisites...\n")
         ok = True
-        if shutil.which(self.vagrant): print(f"{OK} Vagrant")
-        else: print(f"{ERR} Vagrant not found"); ok = False
-        if self.provider == "vmware_desktop":
-            if any(shutil.which(x) for x in ["vmrun", "vmrun.exe"]): print(f"{OK} VMware")
-            else: print(f"{ERR} VMware not found"); ok = False
+        if self.sim:
+            import simlab
+            try: print(f"{OK} Simulated backend, replaying {simlab.recording()}")
+            except SystemExit as e: print(f"{ERR} {e}"); ok = False
         else:
-            if any(shutil.which(x) for x in ["VBoxManage", "VBoxManage.exe"]): print(f"{OK} VirtualBox")
-            else: print(f"{ERR} VirtualBox not found"); ok = False
+            if shutil.which(self.vagrant): print(f"{OK} Vagrant")
+            else: print(f"{ERR} Vagrant not found"); ok = False
+            if self.provider == "vmware_desktop":
+                if any(shutil.which(x) for x in ["vmrun", "vmrun.exe"]): print(f"{OK} VMware")
+                else: print(f"{ERR} VMware not found"); ok = False
+            else:
+                if any(shutil.which(x) for x in ["VBoxManage", "VBoxManage.exe"]): print(f"{OK} VirtualBox")
+                else: print(f"{ERR} VirtualBox not found"); ok = False
+
+        print(f"\n{INFO} Measuring host...\n")
+        res = host_resources(self.dir, self.os == "wsl", disk_test=True)
+        mem = f"{res['mem_avail']}/{res['mem_total']} MB free" if res["mem_total"] else "RAM unknown"
+        print(f"{OK} {mem} | {res['cores']} cores | {res['disk_free']} GB free disk, {res['disk_mbps']} MB/s write")
+        prof = size_profile(res)
+        with open(".cerberus_sizing", "w") as f: json.dump(prof, f, indent=1)
+        for vm, v in prof["vms"].items(): print(f"    {vm:<8} {v['memory']:>5} MB  {v['cpus']} vCPU")
+        print(f"    boot {prof['parallel']} VM(s) at once -> .cerberus_sizing")
+        for w in overcommit(prof, res): print(f"{INFO} {w}")
         print(f"\n{OK if ok else ERR} {'All OK' if ok else 'Errors found'}\n")
 
-    def start(self, verbose=False):
+    def sizing(self):
+        """Host-wide profile written by `check`; the Vagrantfile's defaults when there is none."""
+        try:
+            with open(".cerberus_sizing") as f: return json.load(f)
+        except (OSError, ValueError):
+            return {"vms": {vm: {"memory": m, "cpus": c} for vm, (m, c, _) in VM_SIZES.items()}, "parallel": 4}
+
+    def _preflight(self):
+        if self.sim: return     # simulated VMs take no host RAM, cores or disk
+        prof = self.sizing()
+        if "at" not in prof: print(f"{INFO} No sizing profile, using defaults (run check)")
+        for w in overcommit(prof, host_resources(self.dir, self.os == "wsl")): print(f"{INFO} {w}")
+
+    def _ansible_hash(self):
+        return tree_hash("ansible")
+
+    def _snapshots(self, data=None):
+        """Snapshot metadata in .cerberus_snapshots; pass `data` to write it."""
+        path = self._file(".cerberus_snapshots")
+        if data is not None:
+            with open(path, "w") as f: json.dump(data, f, indent=1)
+            return data
+        if not os.path.exists(path): return {}
+        try:
+            with open(path) as f: return json.load(f)
+        except ValueError: return {}
+
+    def _each_vm(self, fn):
+        with pool(len(self.VMS)) as ex:
+            rcs = list(ex.map(fn, self.VMS))
+        return [vm for vm, rc in zip(self.VMS, rcs) if rc != 0]
+
+    def snapshot(self, action="list", tag="baseline"):
+        snaps = self._snapshots()
+        cur = self._ansible_hash()
+        if action == "list":
+            if not snaps: print(f"{INFO} No snapshots\n"); return
+            print()
+            for t, m in sorted(snaps.items(), key=lambda x: x[1]["created"]):
+                stale = f"{Colors.EMBER}stale{Colors.ENDC}" if m["ansible"] != cur else f"{Colors.GREEN}current{Colors.ENDC}"
+                print(f"  {t:<15} {m['created']}  {m['provider']:<15} {stale}")
+            print()
+        elif action == "save":
+            self.ssh.close()
+            print(f"{INFO} Saving '{tag}' on {', '.join(self.VMS)}...")
+            failed = self._each_vm(lambda vm: self._run(f"{self.vagrant} snapshot save {vm} {tag} --force", check=False)[0])
+            if failed: print(f"{ERR} Snapshot failed on: {', '.join(failed)}\n"); return
+            snaps[tag] = {"created": datetime.now().isoformat(timespec="seconds"), "provider": self.provider,
+                          "ansible": cur, "vms": list(self.VMS)}
+            self._snapshots(snaps)
+            print(f"{OK} Saved '{tag}'\n")
+        elif action == "restore":
+            if tag not in snaps: print(f"{ERR} Unknown snapshot '{tag}'\n"); return
+            if snaps[tag]["ansible"] != cur and input(f"{INFO} '{tag}' predates changes in ansible/. Restore anyway? (y/N) ").lower() != 'y': return
+            try:
+                self._restore(tag)
+                print(f"{OK} Restored '{tag}'\n")
+            except Exception as e: print(f"{ERR} {e}\n")
+        else: print(f"{ERR} snapshot save|restore|list [tag]\n")
+
+    def _restore(self, tag):
+        """Restore all VMs in parallel, then only re-run health checks."""
+        self.ssh.close()
+        failed = self._each_vm(lambda vm: self._run(f"{self.vagrant} snapshot restore {vm} {tag} --no-provision", f"Restore {vm}", check=False)[0])
+        if failed: raise Exception(f"Restore failed on: {', '.join(failed)}")
+        res = self._wait_ready(["ssh:admin", "ssh:node01", "ssh:node02", "winrm:winsrv", "zabbix-api", "vip"], 300)
+        snap = self._snapshots().get(tag, {})
+        if snap.get("ansible") == self._ansible_hash():
+            phases = self.phases()
+            state = PhaseState(phases, self._file(".cerberus_state"), resume=False)
+            for p in phases: state.record(p)
+        return res
+
+    def _timed(self, p):
+        fn = p.fn
+        def run():
+            t0 = time.time()
+            self._event("phase_start", phase=p.name, lane=p.lane)
+            try: fn()
+            except Exception as e:
+                self._event("phase_end", phase=p.name, ok=False, secs=round(time.time()-t0, 2), error=str(e))
+                raise
+            self._event("phase_end", phase=p.name, ok=True, secs=round(time.time()-t0, 2))
+        return run
+
+    def _skipped(self, p):
+        self._log(f"SKIP: {p.name}")
+        self._event("phase_skip", phase=p.name)
+
+    def _pkg_cache(self):
+        """Start the host package cache (pkgcache.py), or attach to one another deploy already runs, and
+        hand its address to the Vagrantfile. Returns (cache, stats before) or None."""
+        if self.sim: return None
+        if self.os == "wsl": print(f"{INFO} Package cache: not available under WSL (the VMs can't reach it)"); return None
+        import pkgcache
+        try: pc = pkgcache.PackageCache().start()
+        except OSError as e: print(f"{INFO} Package cache not started: {e}"); return None
+        url = f"http://{self.inst.subnet}.1:{pc.port}"
+        self.env["CERBERUS_PKG_PROXY"] = url
+        print(f"{OK} Package cache: {Colors.ASH}{url}{' (shared)' if pc.shared else ''}{Colors.ENDC}")
+        return pc, pc.stats()
+
+    def _pkg_cache_done(self, pkg):
+        """Point the VMs back at their own mirrors, then report hit rates (overall and per VM)."""
+        import pkgcache
+        pc, before = pkg
+        self.env.pop("CERBERUS_PKG_PROXY", None)
+        off = "test ! -x /usr/local/sbin/cerberus-pkg-cache || sudo /usr/local/sbin/cerberus-pkg-cache off"
+        def undo(vm):
+            # Also when the job was cancelled: that is when it matters most
+            try: return self._ssh(vm, off, check=False, cancellable=False, timeout=60)[0] == 0
+            except Exception as e: self._log(f"Package cache off on {vm}: {e}"); return False
+        names = ("admin", "node01", "node02")
+        with pool(3) as ex: left = [vm for vm, ok in zip(names, ex.map(undo, names)) if not ok]
+        if left: print(f"{INFO} Package cache: could not turn it off on {', '.join(left)} (if provisioned, run 'sudo cerberus-pkg-cache off' there)")
+        # Closed only now that every VM was pointed back (a shared cache stays up for its owner)
+        after = pc.stats()
+        pc.close()
+        # Only this lab's VMs: a shared cache also counts other instances' requests
+        vms = {self.inst.ip(vm): vm for vm in ("admin", "node01", "node02")}
+        mine = lambda st: {ip: c for ip, c in st.get("clients", {}).items() if ip in vms}
+        total = lambda cs: {k: sum(c.get(k, 0) for c in cs.values()) for k in ("hits", "misses", "bytes_hit", "bytes_miss", "passed", "tunnels", "errors")}
+        b, a = mine(before), mine(after)
+        tb, ta = total(b), total(a)
+        line = pkgcache.report(tb, ta)
+        if not line: return
+        per = []
+        for ip, c in sorted(a.items(), key=lambda x: vms[x[0]]):
+            h, m = c["hits"] - b.get(ip, {}).get("hits", 0), c["misses"] - b.get(ip, {}).get("misses", 0)
+            if h + m: per.append(f"{vms[ip]} {100 * h // (h + m)}%")
+        print(f"{OK} Package cache: {line}" + (f" ({', '.join(per)})" if per else ""))
+        self._log(f"Package cache: {line}")
+        self._event("pkg_cache", **{k: ta[k] - tb[k] for k in ta})
+
+    def start(self, verbose=False, resume=False, snapshot=None, yes=False, cache=True):
         self.verbose = verbose
-        os.makedirs("logs", exist_ok=True)
-        self.log = f"logs/install_{datetime.now():%Y-%m-%d_%H-%M-%S}.txt"
+        os.makedirs(self.logdir, exist_ok=True)
+        self._open_log(os.path.join(self.logdir, f"install_{datetime.now():%Y-%m-%d_%H-%M-%S}.txt"))
         start = time.time()
         
         print(f"\n{'='*60}")
@@ -127,70 +1400,347 @@ class Lab:
         print(f"{'='*60}\n")
         print(f"{OK} Provider: {Colors.PURPLE}{self.provider}{Colors.ENDC}")
         print(f"{OK} Log: {Colors.ASH}{self.log}{Colors.ENDC}\n")
+        if not yes and not snapshot: self._preflight(); print()
+        
+        if snapshot:
+            meta = self._snapshots().get(snapshot)
+            if not meta: print(f"{ERR} Unknown snapshot '{snapshot}'\n"); self._close_log(); return False
+            print(f"{OK} Snapshot: {Colors.PURPLE}{snapshot}{Colors.ENDC} ({meta['created']})")
+            if meta["ansible"] != self._ansible_hash(): print(f"{INFO} ansible/ changed since this snapshot was taken")
+            print()
         
-        if input(f"Start deployment? (y/N) ").lower() != 'y':
-            return
+        if not yes and input(f"Start deployment? (y/N) ").lower() != 'y':
+            self._close_log()
+            return False
         
         print()
-        pb = ProgressBar(8)
+        if snapshot:
+            self._event("run_start", mode="snapshot", snapshot=snapshot)
+            try:
+                for name, t in self._restore(snapshot).items(): print(f"{OK} {name:<14} ready in {t:.1f}s")
+                elapsed = time.time() - start
+                self._event("run_end", ok=True, secs=round(elapsed, 2))
+                print(f"\n{Colors.GREEN}Success!{Colors.ENDC} Duration: {Colors.GOLD}{int(elapsed//60):02d}m {int(elapsed%60):02d}s{Colors.ENDC}\n")
+                self.info()
+                return True
+            except Exception as e:
+                self._event("run_end", ok=False, secs=round(time.time()-start, 2), error=str(e))
+                print(f"\n{ERR} Failed: {e}")
+                print(f"{INFO} Check: logs\n")
+            finally:
+                self._close_log()
+            return False
+        phases = self.phases()
+        state = PhaseState(phases, self._file(".cerberus_state"), resume)
+        if resume:
+            n = sum(state.fresh(p) for p in phases)
+            print(f"{INFO} Resume: {n}/{len(phases)} phases up to date\n")
+        pkg = self._pkg_cache() if cache else None
+        pb = ProgressBar(len(phases), lanes=("linux", "windows"), live=not verbose)
+        self.pb, self.lanes = pb, {p.name: p.lane for p in phases}
         
+        for p in phases: p.fn = self._timed(p)
+        self._event("run_start", mode="resume" if resume else "full", workers=self.workers)
         try:
-            pb.update(1, "Linux VMs")
-            self._run(f"{self.vagrant} up admin node01 node02 --provider={self.provider}", "Linux VMs", silent=not verbose)
-            time.sleep(30)
-            
-            pb.update(2, "SSH Setup")
-            self._run(f'{self.vagrant} ssh admin -c "sudo apt-get update && sudo apt-get install -y sshpass"', silent=True)
-            self._run(f'{self.vagrant} ssh admin -c "sshpass -p ansible ssh-copy-id -o StrictHostKeyChecking=no ansible@192.168.56.21"', silent=True)
-            self._run(f'{self.vagrant} ssh admin -c "sshpass -p ansible ssh-copy-id -o StrictHostKeyChecking=no ansible@192.168.56.22"', silent=True)
-            
-            pb.update(3, "Ansible Linux")
-            self._run(f'{self.vagrant} ssh admin -c "cd /home/vagrant/ansible && ANSIBLE_HOST_KEY_CHECKING=False ansible-playbook -i inventory/hosts site.yml --limit admin,node01,node02"', "Ansible Linux", silent=not verbose)
-            
-            pb.update(4, "Windows VM")
-            self._run(f"{self.vagrant} up winsrv --provider={self.provider}", "Windows VM", silent=not verbose)
-            
-            pb.update(5, "WinRM")
-            if not self._wait_winrm(): raise Exception("WinRM timeout")
-            time.sleep(10)
-            
-            pb.update(6, "Ansible Windows")
-            self._run(f'{self.vagrant} ssh admin -c "cd /home/vagrant/ansible && ANSIBLE_HOST_KEY_CHECKING=False ansible-playbook -i inventory/hosts site.yml --limit winsrv"', "Ansible Windows", silent=not verbose)
-            
-            pb.update(7, "PHP Fix")
-            self._run(f'{self.vagrant} ssh admin -c "sudo sed -i s/post_max_size=8M/post_max_size=16M/ /etc/php/8.1/fpm/php.ini; sudo systemctl restart php8.1-fpm"', silent=True, check=False)
-            
-            pb.update(8, "Dashboard")
-            self._run(f'{self.vagrant} ssh admin -c "cd /home/vagrant/ansible && ansible-playbook create-dashboard.yml"', "Dashboard", silent=not verbose, check=False)
-            
+            Scheduler(phases, self.workers, pb, state, self._skipped).run()
+            self._event("run_end", ok=True, secs=round(time.time()-start, 2))
             pb.done()
             elapsed = time.time() - start
             print(f"\n{Colors.GREEN}Success!{Colors.ENDC} Duration: {Colors.GOLD}{int(elapsed//60):02d}m {int(elapsed%60):02d}s{Colors.ENDC}\n")
+            if pkg: self._pkg_cache_done(pkg); pkg = None; print()
             self.info()
+            return True
             
         except Exception as e:
+            self._event("run_end", ok=False, secs=round(time.time()-start, 2), error=str(e))
             print(f"\n{ERR} Failed: {e}")
             print(f"{INFO} Check: logs\n")
+            return False
+        finally:
+            # Also on failure: a VM left pointing at a cache that is gone could not install anything
+            if pkg: self._pkg_cache_done(pkg)
+            self.pb, self.lanes = None, {}
+            self._close_log()
+
+    def phases(self):
+        """Deployment graph. The Windows lane needs admin up to run its playbook from there."""
+        v, silent = self.vagrant, not self.verbose
+        par = self.sizing()["parallel"]
+        # parallel >= 4: all four VMs boot together; 2-3: Linux VMs one by one next to Windows; 1: strictly one at a time
+        up_linux = f"{v} up admin node01 node02 --provider={self.provider}" + ("" if par >= 4 else " --no-parallel")
+        boot = threading.Semaphore(1 if par < 2 else 2)
+        def up(cmd, name):
+            with boot: self._run(cmd, name, silent=silent)
+        admin = lambda c, name=None, check=True, quiet=True: self._ssh("admin", c, name, check=check, silent=quiet)
+        playbook = f"cd /home/vagrant/ansible && ANSIBLE_HOST_KEY_CHECKING=False ansible-playbook {self.inst.ansible_args()} site.yml"
+
+        def linux_vms():
+            up(up_linux, "Linux VMs")
+            self._wait_ready(["ssh:admin", "ssh:node01", "ssh:node02"], 300)
+            self.ssh.resolve("admin", "node01", "node02")
+        def ssh_setup():
+            admin("command -v sshpass >/dev/null || (sudo apt-get update && sudo apt-get install -y sshpass)")
+            with pool(2) as ex:
+                for f in [ex.submit(admin, f"sshpass -p ansible ssh-copy-id -o StrictHostKeyChecking=no ansible@{ip}")
+                          for ip in (self.inst.ip("node01"), self.inst.ip("node02"))]: f.result()
+        def winrm():
+            if not self._wait_winrm(): raise Exception("WinRM timeout")
+        def cluster():
+            if not self.cluster_watch(timeout=300, quiet=True): raise Exception("HA resource group did not converge (see logs)")
+        def dashboard():
+            self._wait_ready(["zabbix-api", "vip"], 300)
+            admin(f"cd /home/vagrant/ansible && ansible-playbook {self.inst.ansible_args()} create-dashboard.yml", "Dashboard", quiet=silent)
+
+        common = ["ansible/site.yml", "ansible/ansible.cfg", "ansible/inventory", "ansible/group_vars"]
+        if self.inst.n: common += [os.path.join(self.inst.dir, f) for f in ("hosts", "vars.yml")]
+        roles = lambda *names: [f"ansible/roles/{r}" for r in names]
+        return [
+            Phase("Linux VMs", linux_vms, lane="linux", inputs=["Vagrantfile"], always=True),
+            Phase("SSH Setup", ssh_setup, ["Linux VMs"], lane="linux", inputs=["ansible/inventory"]),
+            Phase("Ansible Linux", lambda: admin(f"{playbook} --limit admin,node01,node02", "Ansible Linux", quiet=silent), ["SSH Setup"], lane="linux",
+                  inputs=common + roles("zabbix-server", "ha-cluster", "nginx", "samba", "cluster-resources", "hardening-linux", "zabbix-agent")),
+            Phase("PHP Fix", lambda: admin("sudo sed -i s/post_max_size=8M/post_max_size=16M/ /etc/php/8.1/fpm/php.ini; sudo systemctl restart php8.1-fpm", "PHP Fix"), ["Ansible Linux"], lane="linux"),
+            Phase("Windows VM", lambda: up(f"{v} up winsrv --provider={self.provider}", "Windows VM"), lane="windows",
+                  inputs=["Vagrantfile", "scripts"], always=True),
+            Phase("WinRM", winrm, ["Windows VM"], lane="windows", always=True),
+            Phase("Ansible Windows", lambda: admin(f"{playbook} --limit winsrv", "Ansible Windows", quiet=silent), ["WinRM", "Linux VMs"], lane="windows",
+                  inputs=common + roles("windows-ad", "windows-hardening")),
+            Phase("Cluster", cluster, ["Ansible Linux"], lane="linux", inputs=roles("ha-cluster", "cluster-resources"), always=True),
+            Phase("Dashboard", dashboard, ["PHP Fix", "Cluster", "Ansible Windows"], lane="linux",
+                  inputs=["ansible/create-dashboard.py", "ansible/create-dashboard.yml"]),
+        ]
 
     def stop(self):
+        self.ssh.close()
         self._run(f"{self.vagrant} halt", check=False)
         print(f"{OK} Stopped\n")
 
-    def cleanup(self):
-        if input(f"Destroy all? (y/N) ").lower() != 'y': return
-        self._run(f"{self.vagrant} destroy -f", check=False)
+    def cleanup(self, yes=False):
+        if not yes and input(f"Destroy all? (y/N) ").lower() != 'y': return
+        self.ssh.close()
+        rc, _ = self._run(f"{self.vagrant} destroy -f", check=False)
+        if rc != 0:
+            # Some VMs (and their snapshots) may still exist: keep what describes them
+            print(f"{ERR} vagrant destroy failed (exit {rc}); state and snapshot list kept\n")
+            return False
+        PhaseState.clear(self._file(".cerberus_state"))
+        self._snapshots({})
+        if self.inst.n and not self.sim: shutil.rmtree(self.inst.dir, ignore_errors=True)
         print(f"{OK} Cleaned\n")
+        return True
 
-    def logs(self, n=50):
-        files = sorted(glob.glob("logs/install_*.txt"), reverse=True)
+    def _log_line(self, line):
+        c = Colors.GREEN if "OK" in line else Colors.EMBER if "FAIL" in line else Colors.ASH
+        print(f"{c}{line.rstrip()}{Colors.ENDC}")
+
+    def logs(self, n=50, follow=False, phase=None, run=None, markers=False, failed=False, list_runs=False):
+        files = sorted(glob.glob(os.path.join(self.logdir, "install_*.txt")), reverse=True)
         if not files: print(f"{INFO} No logs\n"); return
+        if list_runs:
+            print()
+            for path in files:
+                st = {k: sum(1 for s in LogFile(path).sections().values() if s[2] == k) for k in ("OK", "FAIL", "SKIP")}
+                print(f"  {LogFile(path).id}  {os.path.getsize(path)//1024:>6} KB  ok={st['OK']} fail={st['FAIL']} skip={st['SKIP']}")
+            print(); return
+        if run: files = [f for f in files if run in os.path.basename(f)]
+        if not files: print(f"{ERR} No log matching '{run}'\n"); return
+        log = LogFile(files[0])
         print(f"{OK} {files[0]}\n")
-        with open(files[0], encoding='utf-8', errors='replace') as f:
-            for line in f.readlines()[-n:]:
-                c = Colors.GREEN if "OK" in line else Colors.EMBER if "FAIL" in line else Colors.ASH
-                print(f"{c}{line.rstrip()}{Colors.ENDC}")
+        if markers:
+            for off, ts, kind, name in log.index(): self._log_line(f"[{ts}] {kind}: {name}")
+        elif phase or failed:
+            secs = log.sections()
+            names = [k for k in secs if phase.lower() in k.lower()] if phase else [k for k, s in secs.items() if s[2] == "FAIL"]
+            if not names: print(f"{INFO} {'No phase matching ' + repr(phase) if phase else 'No failed phase'}")
+            for name in names:
+                start, end, status = secs[name]
+                print(f"{Colors.PURPLE}--- {name} ({status}) ---{Colors.ENDC}")
+                end = os.path.getsize(log.path) if end is None else log.line_end(end)
+                for line in log.tail(n, start, end): self._log_line(line)
+        else:
+            for line in log.tail(n): self._log_line(line)
+        if follow:
+            print(f"{INFO} Following {log.path} (Ctrl+C to stop)")
+            try:
+                for line in log.follow(): self._log_line(line)
+            except KeyboardInterrupt: pass
         print()
 
+    def bench(self, a=None, b=None, top=10):
+        """Where the time goes: per-phase p50/p95 over all runs, slowest Ansible tasks,
+        and what got slower between run `a` and run `b` (default: the last two)."""
+        runs = [r for r in load_runs(self.logdir) if r["phases"]]
+        if not runs: print(f"{INFO} No timed runs in {self.logdir}/\n"); return
+        names = list(dict.fromkeys(n for r in runs for n in r["phases"]))
+        print(f"\n=== PHASES ({len(runs)} runs) ===\n")
+        print(f"  {'phase':<20} {'runs':>4} {'p50':>6} {'p95':>6} {'last':>6}")
+        for n in names:
+            xs = [r["phases"][n] for r in runs if n in r["phases"]]
+            last = next((r["phases"][n] for r in reversed(runs) if n in r["phases"]), 0)
+            print(f"  {n:<20} {len(xs):>4} {mmss(percentile(xs, 50)):>6} {mmss(percentile(xs, 95)):>6} {mmss(last):>6}")
+
+        tasks = {}
+        for r in runs:
+            for k, secs in r["tasks"].items(): tasks.setdefault(k, []).append(secs)
+        if tasks:
+            print(f"\n=== SLOWEST TASKS (p50) ===\n")
+            for (phase, task), xs in sorted(tasks.items(), key=lambda kv: -percentile(kv[1], 50))[:top]:
+                print(f"  {mmss(percentile(xs, 50)):>6}  {Colors.ASH}{phase:<16}{Colors.ENDC} {task[:60]}")
+
+        pick = lambda rid, default: next((r for r in runs if rid in r["id"]), None) if rid else default
+        old = pick(a, runs[-2] if len(runs) > 1 else None)
+        new = pick(b, runs[-1])
+        if not old or not new or old is new:
+            print(); return
+        print(f"\n=== {old['id']} -> {new['id']} ===\n")
+        rows = [(n, old["phases"].get(n), new["phases"].get(n)) for n in names]
+        rows += [(f"  {t[:40]}", old["tasks"].get((p, t)), new["tasks"].get((p, t))) for p, t in tasks]
+        slower = 0
+        for n, x, y in rows:
+            if x is None or y is None: continue
+            d = y - x
+            if d > max(5, 0.1*x):
+                slower += 1
+                print(f"  {Colors.EMBER}+{mmss(d)}{Colors.ENDC}  {n:<44} {mmss(x)} -> {mmss(y)}")
+            elif not n.startswith(" ") and -d > max(5, 0.1*x):
+                print(f"  {Colors.GREEN}-{mmss(-d)}{Colors.ENDC}  {n:<44} {mmss(x)} -> {mmss(y)}")
+        if not slower: print(f"{OK} No regressions")
+        print()
+
+    def _vip_node(self):
+        for vm in ("node01", "node02"):
+            rc, out = self._ssh(vm, "sudo crm_resource --resource cluster-vip --locate", check=False)
+            m = re.search(r"running on:\s*(\S+)", out)
+            if m: return m.group(1)
+        raise Exception("cluster-vip is not running")
+
+    def cluster_watch(self, timeout=180, follow=False, quiet=False):
+        """Timeline of the HA resources as Pacemaker starts or moves them, from crm_mon on node01 over one
+        ssh session. Returns once the resource group has converged (True), or False on timeout."""
+        with open("ansible/group_vars/ha_cluster.yml", encoding="utf-8") as f:
+            m = re.search(r'^resource_group_name:\s*"?([\w-]+)', f.read(), re.M)
+        def show(e):
+            line = (f"+{e['at']:6.1f}s  {e['resource']:<12} {e['from'] or '-'} -> {e['to']}" + (f" on {e['node']}" if e["node"] else "")
+                    + (" FAILED" if e["failed"] else "") + (f"  ({e['latency']:.1f}s)" if e["latency"] is not None else ""))
+            self._log(f"cluster {line}")
+            self._event("cluster", **e)
+            if not quiet: print(f"  {line}")
+        w = ClusterWatch(m.group(1) if m else "ha-services", follow=follow, on_change=show)
+        if not quiet: print(f"\n{INFO} Watching {w.group} on node01" + (" (Ctrl+C to stop)" if follow else f", up to {timeout}s") + "\n")
+        try: cmd = self.ssh.cmd("node01", ClusterWatch.CMD)
+        except Exception as e:
+            self._log(f"cluster watch: {e}")
+            if not quiet: print(f"{ERR} {e}\n")
+            return False
+        try: self._run(cmd, check=False, log=False, timeout=None if follow else timeout, parser=w)
+        except KeyboardInterrupt: pass
+        lat = ", ".join(f"{r} {w.latency[r]:.1f}s" for r in w.resources if r in w.latency)
+        if w.converged_at is not None:
+            msg = f"{w.group} converged on {w.node()} after {w.converged_at:.1f}s" + (f" ({lat})" if lat else " (already running)")
+            self._log(msg)
+            if not quiet: print(f"\n{OK} {msg}\n")
+            return True
+        missing = [r for r in w.resources if (w.state.get(r) or ("Absent",))[0] != "Started"]
+        msg = f"{w.group} not converged after {timeout}s" + (f": {', '.join(missing)} not started" if missing else "") + ("" if w.polls else " (no crm_mon output)")
+        self._log(msg)
+        if not quiet: print(f"\n{ERR} {msg}\n")
+        return False
+
+    def failover(self, conns=50, warmup=10, duration=30):
+        """Keep load on the VIP, put the node holding the resource group in standby, measure, then restore it."""
+        vip, port = self.endpoints["vip"]
+        try: active = self._vip_node()
+        except Exception as e: print(f"{ERR} {e}\n"); return
+        print(f"\n{INFO} {conns} connections to {vip} | {active} -> standby after {warmup}s | {warmup+duration}s total")
+        errors = []
+        def standby():
+            rc, out = self._ssh(active, f"sudo pcs node standby {active}", check=False)
+            if rc: errors.append(f"pcs node standby {active} exited {rc}: {out.strip().splitlines()[-1] if out.strip() else 'no output'}")
+        gen = LoadGen(vip, port, conns=conns)
+        import asyncio
+        try: marks = asyncio.run(gen.run(warmup + duration, [(warmup, standby)]))
+        except Exception as e: marks, errors = {}, errors + [str(e)]
+        finally:
+            try: self._ssh(active, f"sudo pcs node unstandby {active}", check=False)
+            except Exception: pass
+        if errors or "standby" not in marks: print(f"{ERR} standby failed{': ' + errors[0] if errors else ''}\n"); return
+        rep = failover_report(gen.samples, marks["standby"][0], marks["standby"][1], marks["load"][1])
+        try: now = self._vip_node()
+        except Exception: now = None
+        res = {"at": datetime.now().isoformat(timespec="seconds"), "vip": vip, "conns": conns, "warmup": warmup,
+               "duration": duration, "from": active, "to": now, "standby_cmd_secs": round(marks["standby"][1] - marks["standby"][0], 3), **rep}
+        prev = sorted(glob.glob(os.path.join(self.logdir, "failover_*.json")))
+        os.makedirs(self.logdir, exist_ok=True)
+        path = os.path.join(self.logdir, f"failover_{datetime.now():%Y-%m-%d_%H-%M-%S}.json")
+        with open(path, "w") as f: json.dump(res, f, indent=1)
+
+        fmt = lambda v: "-" if v is None else f"{v:.3f}s"
+        print(f"\n=== FAILOVER {active} -> {now or '?'} ===\n")
+        print(f"  time to first failure  {fmt(rep['time_to_first_failure'])}")
+        print(f"  outage                 {fmt(rep['outage'])}  ({rep['failed_requests']} failed requests)")
+        print(f"\n  {'window':<8} {'secs':>7} {'req':>7} {'err':>6} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9}")
+        for w in ("before", "during", "after"):
+            x = rep[w]
+            ms = lambda v: "-" if v is None else f"{v:.1f}"
+            print(f"  {w:<8} {x['secs']:>7.1f} {x['requests']:>7} {x['errors']:>6} {x['rps']:>8.1f} {ms(x['p50_ms']):>8} {ms(x['p99_ms']):>8} {ms(x['p99.9_ms']):>9}")
+        if prev:
+            with open(prev[-1]) as f: old = json.load(f)
+            d = lambda k: (rep[k] or 0) - (old.get(k) or 0)
+            print(f"\n  vs {os.path.basename(prev[-1])}: outage {d('outage'):+.3f}s, first failure {d('time_to_first_failure'):+.3f}s")
+        print(f"\n{OK} {path}\n")
+
+    def fleet(self, action="list", ids=()):
+        """Several isolated labs on one host. `up`/`down` run one `deploy.py --instance N` per lab
+        concurrently; `up` only starts as many labs as there is memory for, a few at a time per core count."""
+        if action == "list":
+            insts = Instance.existing()
+            with pool(len(insts)) as ex: states = list(ex.map(lambda i: VMStatus.summary(self._vm_status(i).get(wait=True), self.VMS), insts))
+            print()
+            for inst, st in zip(insts, states):
+                runs = load_runs(self._dirs(inst)[1])
+                last = f"{Colors.GREEN}ok{Colors.ENDC}" if runs and runs[-1]["ok"] else f"{Colors.EMBER}failed{Colors.ENDC}" if runs else "never"
+                cur = "*" if inst.n == self.inst.n else " "
+                print(f" {cur}{inst.n} {inst.name:<8} {inst.subnet}.0/24  http {inst.ports['http']:<5} rdp {inst.ports['rdp']:<6} {inst.prefix + '-*':<12} {st:<22} last deploy: {last}")
+            print(); return
+        try: targets = [Instance(n) for n in Instance.parse(ids)]
+        except ValueError as e: print(f"{ERR} {e}\n"); return False
+        if action not in ("up", "down") or not targets: print(f"{ERR} fleet up|down <ids>, e.g. fleet up 1-3\n"); return False
+        py = f'"{sys.executable}" deploy.py'
+        if action == "up":
+            res = host_resources(self.dir, self.os == "wsl")
+            need = 0 if self.sim else sum(v["memory"] for v in self.sizing()["vms"].values())
+            fit = max(0, ((res["mem_avail"] or res["mem_total"] or 0) - HOST_RESERVE) // need) if need else len(targets)
+            if fit < len(targets):
+                print(f"{INFO} Memory for {fit} more lab(s) at {need} MB each: not starting {', '.join(i.name for i in targets[fit:])}")
+                targets = targets[:fit]
+                if not targets: print(); return False
+            at_once = len(targets) if self.sim else max(1, min(len(targets), res["cores"] // 4))
+            cmd = lambda i: f"{py} --instance {i.n} start -y -j {self.workers}"
+            # One package cache for the whole fleet: each lab attaches to it, and it outlives the first to finish
+            shared = None
+            if not self.sim and self.os != "wsl":
+                import pkgcache
+                try: shared = pkgcache.PackageCache().start()
+                except OSError: pass
+        else:
+            at_once, shared = len(targets), None
+            cmd = lambda i: f"{py} --instance {i.n} cleanup -y"
+        print(f"{INFO} fleet {action}: {', '.join(i.name for i in targets)} ({at_once} at a time)")
+        t0 = time.time()
+        def one(inst):
+            logdir = self._dirs(inst)[1]
+            os.makedirs(logdir, exist_ok=True)
+            out = os.path.join(logdir, f"fleet_{action}.txt")
+            rc, _ = self._run(cmd(inst), check=False, log=False, spill=out, tail=1)
+            print(f"{OK if rc == 0 else ERR} {inst.name:<8} {action} {'ok' if rc == 0 else 'FAILED'} after {mmss(time.time()-t0)}  {Colors.ASH}{out}{Colors.ENDC}")
+            return rc == 0
+        try:
+            with pool(at_once) as ex: ok = all(list(ex.map(one, targets)))
+        finally:
+            if shared: shared.close()
+        print()
+        return ok
+
     def creds(self):
         print(f"\n=== CREDENTIALS ===\n")
         for s, items in [
@@ -205,21 +1755,22 @@ class Lab:
             for u, p in items: print(f"    {u}: {p}")
         print()
         print(f"=== IP ADDRESSES ===\n")
-        print(f"[*] Admin (Zabbix):  192.168.56.10")
-        print(f"[*] Node01:          192.168.56.21")
-        print(f"[*] Node02:          192.168.56.22")
-        print(f"[*] WinSrv (AD):     192.168.56.30")
-        print(f"[*] VIP:             192.168.56.100")
+        ip = self.inst.ip
+        print(f"[*] Admin (Zabbix):  {ip('admin')}")
+        print(f"[*] Node01:          {ip('node01')}")
+        print(f"[*] Node02:          {ip('node02')}")
+        print(f"[*] WinSrv (AD):     {ip('winsrv')}")
+        print(f"[*] VIP:             {ip('vip')}")
         print()
 
     def info(self):
         print(f"\n=== ACCESS ===\n")
-        print(f"Zabbix:   http://192.168.56.10/ (Admin/zabbix)")
-        print(f"VIP:      http://192.168.56.100/")
-        print(f"RDP:      192.168.56.30:3389 (CERBERUS\\Administrator)\n")
+        ip = self.inst.ip
+        print(f"Zabbix:   http://{ip('admin')}/ (Admin/zabbix)")
+        print(f"VIP:      http://{ip('vip')}/")
+        print(f"RDP:      {ip('winsrv')}:3389 (CERBERUS\\Administrator)\n")
 
     def banner(self):
-        os.system('cls' if os.name == 'nt' else 'clear')
         print("""
                                              %@@@@%*                                           %@@@%*                                                                                             
                                              @@##*#@@*              =  #%%#                 #@@@#+*@%                                             
@@ -252,83 +1803,240 @@ class Lab:
                                                 \___\___|_|  |_.__/ \___|_|   \__,_|___/
                                              
         """)
-        time.sleep(1)
+
     def status(self):
-        try:
-            out = subprocess.check_output(f"{self.vagrant} status", shell=True, text=True, 
-                                         encoding='utf-8', errors='replace', timeout=10)
-            st = "running" if "running" in out else "stopped" if "poweroff" in out else "not created"
-            c = Colors.GREEN if st == "running" else Colors.EMBER
-        except: st, c = "unknown", Colors.ASH
-        print(f"[*] cerberus | {self.provider} | {c}{st}{Colors.ENDC}\n")
+        """One line from the status cache; a stale cache is shown as such and refreshed in the background."""
+        st, age = VMStatus.summary(self.vms.get(), self.VMS), self.vms.age()
+        c = Colors.GREEN if st == "running" else Colors.ASH if st == "unknown" else Colors.EMBER
+        ago = f"{int(age)}s" if age < 120 else f"{int(age // 60)}m" if age < 7200 else f"{int(age // 3600)}h"
+        note = "" if not self.vms.expired() else " (checking...)" if st == "unknown" else f" (as of {ago} ago, refreshing)"
+        print(f"[*] cerberus{'/' + self.inst.name if self.inst.n else ''} | {self.provider} | {c}{st}{Colors.ENDC}{Colors.ASH}{note}{Colors.ENDC}\n")
+
+    def vm_status(self):
+        """Per-VM states, waiting for a refresh if the cache is past its TTL."""
+        vms = self.vms.get(wait=True)
+        if self.vms.error: print(f"{ERR} {self.vms.error}")
+        print()
+        for vm in self.VMS:
+            st = vms.get(vm, "unknown")
+            c = Colors.GREEN if st == "running" else Colors.ASH if st == "unknown" else Colors.EMBER
+            print(f"  {vm:<8} {self.inst.vm_name(vm):<18} {c}{st.replace('_', ' ')}{Colors.ENDC}")
+        print()
+
+    def _busy(self):
+        busy = self.jobs.running()
+        if busy: print(f"{ERR} Job {busy[0].id} ({busy[0].name}) is still running; cancel {busy[0].id} first\n")
+        return bool(busy)
+
+    def _background(self, name, fn):
+        if self._busy(): return
+        job = self.jobs.submit(name, fn)
+        print(f"{OK} Job {job.id}: {name} (attach {job.id} to watch)\n")
+
+    def jobs_list(self):
+        if not self.jobs.jobs: print(f"{INFO} No jobs\n"); return
+        print()
+        for j in self.jobs.jobs.values():
+            c = Colors.GOLD if j.state == "running" else Colors.GREEN if j.state == "done" else Colors.EMBER
+            print(f"  [{j.id}] {j.name:<10} {c}{j.state:<10}{Colors.ENDC} {mmss((j.t1 or time.time()) - j.t0)}  {Colors.ASH}{j.last_line()[:60]}{Colors.ENDC}")
+        print()
+
+    def _job_arg(self, args):
+        try: return self.jobs.jobs[int(args[0])] if args else (self.jobs.running() or list(self.jobs.jobs.values()))[-1]
+        except (ValueError, KeyError, IndexError): print(f"{ERR} No such job\n")
+
+    def attach(self, job):
+        """Replay the job's buffer, then stream it live until Enter (or 'detach')."""
+        out = self.jobs.real or sys.stdout
+        # Replay and switch to live under the job's lock, so nothing it writes in between is lost
+        with job.lock:
+            out.write("".join(job.out))
+            out.write(f"\n{INFO} Attached to job {job.id} ({job.state}) - press Enter to detach\n")
+            job.attached = out
+        try: input()
+        except (KeyboardInterrupt, EOFError): pass
+        finally:
+            with job.lock: job.attached = None
+        print(f"{OK} Detached\n")
+
+    def cancel(self, job):
+        if job.state != "running": print(f"{INFO} Job {job.id} already {job.state}\n"); return
+        job.cancelled.set()
+        job.kill()
+        print(f"{OK} Cancelling job {job.id} ({job.name})\n")
 
     def help(self):
         print(f"\nCommands:")
         for cmd, desc in [
-            ("start [-v]", "deploy"), ("stop", "halt VMs"), ("cleanup", "destroy"),
+            ("start [-v] [-j N]", "deploy (N parallel phases)"), ("start --resume", "skip up-to-date phases"),
+            ("start --from-snapshot [T]", "restore snapshot T"), ("snapshot save|restore|list [T]", "VM snapshots"),
+            ("stop", "halt VMs"), ("cleanup", "destroy"),
             ("status", "VM status"), ("check", "prerequisites"), ("info", "access info"),
-            ("passwd", "credentials"), ("logs [-n N]", "view logs"),
+            ("passwd", "credentials"), ("logs [-n N] [-f]", "view logs, follow"),
+            ("logs -p PHASE | --fail | --markers", "filter"), ("logs --list | -t TS", "pick an older run"), ("bench [A B]", "timing report, A -> B regressions"),
+            ("bench failover [-c N]", "VIP failover latency under load"),
+            ("cluster watch [-f]", "HA resource timeline until converged (-f: keep following)"),
             ("ssh <vm>", "connect"), ("rdp", "Windows RDP"),
+            ("jobs", "background jobs (start/stop/cleanup)"), ("attach [id]", "watch a job, Enter to detach"), ("cancel [id]", "stop a job"),
+            ("instance [N]", "switch to lab instance N (0-7)"), ("fleet list|up|down [ids]", "several labs at once, e.g. fleet up 1-3"),
             ("provider", "change provider"), ("clear", "refresh"), ("exit", "quit")
         ]:
-            print(f"  {cmd:<15} {desc}")
+            print(f"  {cmd:<32} {desc}")
         print()
 
     def menu(self):
         self.banner()
         self.status()
+        self.jobs.install()
         while True:
             try:
-                inp = input(f"Cerberus/{self.provider} > ").strip().split()
+                for j in self.jobs.notices():
+                    print(f"{OK if j.state == 'done' else ERR} Job {j.id} ({j.name}) {j.state}")
+                    self.vms.refresh()
+                inp = input(f"Cerberus{'/' + self.inst.name if self.inst.n else ''}/{self.provider} > ").strip().split()
                 if not inp: continue
                 cmd, args = inp[0].lower(), inp[1:]
                 
-                if cmd == "start": self.start("-v" in args)
-                elif cmd == "stop": self.stop()
-                elif cmd in ["cleanup", "destroy"]: self.cleanup()
-                elif cmd == "status": subprocess.run(f"{self.vagrant} status", shell=True)
+                if cmd == "start":
+                    if "-j" in args:
+                        try: self.workers = int(args[args.index("-j")+1])
+                        except: pass
+                    snap = None
+                    if "--from-snapshot" in args:
+                        i = args.index("--from-snapshot")
+                        snap = args[i+1] if i+1 < len(args) and not args[i+1].startswith("-") else "baseline"
+                    if self._busy(): continue
+                    if not snap: self._preflight()
+                    if input(f"Start deployment ({self.provider})? (y/N) ").lower() != 'y': continue
+                    v, r, c = "-v" in args, "--resume" in args or "-r" in args, "--no-cache" not in args
+                    self._background("start", lambda: self.start(v, r, snap, yes=True, cache=c))
+                elif cmd == "snapshot": self.snapshot(*(args[:2] or ["list"]))
+                elif cmd == "bench" and args[:1] == ["failover"]:
+                    c = 50
+                    if "-c" in args:
+                        try: c = int(args[args.index("-c")+1])
+                        except: pass
+                    self.failover(c)
+                elif cmd == "bench": self.bench(*args[:2])
+                elif cmd == "cluster" and args[:1] == ["watch"]: self.cluster_watch(follow="-f" in args)
+                elif cmd == "stop": self._background("stop", self.stop)
+                elif cmd in ["cleanup", "destroy"]:
+                    if self._busy(): continue
+                    if input(f"Destroy all? (y/N) ").lower() == 'y': self._background("cleanup", lambda: self.cleanup(yes=True))
+                elif cmd == "instance":
+                    if not args: print(f"{OK} {self.inst.name} ({self.inst.subnet}.0/24)\n"); continue
+                    if self._busy(): continue
+                    try: inst = Instance(int(args[0]))
+                    except ValueError as e: print(f"{ERR} {e}\n"); continue
+                    self.inst = inst
+                    self._backend()
+                    print(f"{OK} {inst.name}: {inst.subnet}.0/24, http {inst.ports['http']}, rdp {inst.ports['rdp']}, VMs {inst.prefix}-*\n")
+                elif cmd == "fleet":
+                    action, ids = (args[0], args[1:]) if args else ("list", [])
+                    if action == "list": self.fleet()
+                    elif action == "down" and input(f"Destroy labs {' '.join(ids)}? (y/N) ").lower() != 'y': continue
+                    else: self._background(f"fleet {action}", lambda: self.fleet(action, ids))
+                elif cmd == "jobs": self.jobs_list()
+                elif cmd == "attach":
+                    job = self._job_arg(args)
+                    if job: self.attach(job)
+                elif cmd == "detach": print(f"{INFO} Not attached\n")
+                elif cmd == "cancel":
+                    job = self._job_arg(args)
+                    if job: self.cancel(job)
+                elif cmd == "status": self.vm_status()
                 elif cmd == "check": self.check()
                 elif cmd == "info": self.info()
                 elif cmd in ["passwd", "creds"]: self.creds()
                 elif cmd == "logs":
-                    n = 50
+                    n, phase, run = 50, None, None
                     if "-n" in args:
                         try: n = int(args[args.index("-n")+1])
                         except: pass
-                    self.logs(n)
-                elif cmd == "ssh" and args: subprocess.run(f"{self.vagrant} ssh {args[0]}", shell=True)
+                    if "-p" in args:
+                        rest = args[args.index("-p")+1:]
+                        phase = " ".join(rest[:next((i for i, a in enumerate(rest) if a.startswith("-")), len(rest))]) or None
+                    if "-t" in args and args.index("-t")+1 < len(args): run = args[args.index("-t")+1]
+                    self.logs(n, "-f" in args, phase, run, "--markers" in args, "--fail" in args, "--list" in args)
+                elif cmd == "ssh" and args:
+                    try: subprocess.run(self.ssh.cmd(args[0], tty=True), shell=True)
+                    except Exception as e: print(f"{ERR} {e}")
                 elif cmd == "rdp":
-                    print(f"RDP: 192.168.56.30:3389 | CERBERUS\\Administrator | Vagrant123!")
-                    if shutil.which("mstsc.exe"): subprocess.Popen(["mstsc.exe", "/v:192.168.56.30"])
+                    print(f"RDP: {self.inst.ip('winsrv')}:3389 | CERBERUS\\Administrator | Vagrant123!")
+                    if shutil.which("mstsc.exe"): subprocess.Popen(["mstsc.exe", f"/v:{self.inst.ip('winsrv')}"])
                 elif cmd == "provider":
-                    print(f"\n[1] vmware\n[2] virtualbox\n")
+                    print(f"\n[1] vmware\n[2] virtualbox\n[3] simulated (simlab.py)\n")
                     c = input("Choice: ")
+                    if c in ("1", "2", "3") and self._busy(): continue
                     if c == "1": self._save_cfg("vmware_desktop"); print(f"{OK} VMware\n")
                     elif c == "2": self._save_cfg("virtualbox"); print(f"{OK} VirtualBox\n")
+                    elif c == "3": self._save_cfg("sim"); print(f"{OK} Simulated\n")
                 elif cmd in ["help", "?"]: self.help()
-                elif cmd == "clear": self.banner(); self.status()
-                elif cmd in ["exit", "q"]: print("Goodbye!"); break
+                elif cmd == "clear": os.system('cls' if os.name == 'nt' else 'clear'); self.banner(); self.status()
+                elif cmd in ["exit", "q"]:
+                    if self._quit(): break
                 else: print(f"{ERR} Unknown. Type help")
             except KeyboardInterrupt:
-                print("\nGoodbye!")
-                break
+                print()
+                if self._quit(): break
+        self.ssh.close()
+
+    def _quit(self):
+        busy = self.jobs.running()
+        if busy:
+            try:
+                if input(f"{INFO} {len(busy)} job(s) running. Cancel and exit? (y/N) ").lower() != 'y': return False
+            except KeyboardInterrupt: return False
+            for j in busy: self.cancel(j)
+            for j in busy: j.thread.join(15)
+        print("Goodbye!")
+        return True
 
 if __name__ == "__main__":
-    lab = Lab()
-    if len(sys.argv) == 1:
-        lab.menu()
-    else:
-        p = argparse.ArgumentParser()
-        sub = p.add_subparsers(dest="cmd")
-        s = sub.add_parser("start"); s.add_argument("-v", action="store_true")
-        sub.add_parser("stop"); sub.add_parser("cleanup"); sub.add_parser("check")
-        sub.add_parser("info"); sub.add_parser("passwd")
-        l = sub.add_parser("logs"); l.add_argument("-n", type=int, default=50)
-        args = p.parse_args()
-        if args.cmd == "start": lab.start(args.v)
-        elif args.cmd == "stop": lab.stop()
-        elif args.cmd == "cleanup": lab.cleanup()
-        elif args.cmd == "check": lab.check()
-        elif args.cmd == "info": lab.info()
-        elif args.cmd == "passwd": lab.creds()
-        elif args.cmd == "logs": lab.logs(args.n)
+    p = argparse.ArgumentParser()
+    p.add_argument("-i", "--instance", type=int, default=0, help="lab instance 0-7 (own subnet, ports, VM names)")
+    sub = p.add_subparsers(dest="cmd")
+    s = sub.add_parser("start"); s.add_argument("-v", action="store_true")
+    s.add_argument("-j", type=int, default=2, help="phases run in parallel")
+    s.add_argument("-r", "--resume", action="store_true", help="skip phases completed with unchanged inputs")
+    s.add_argument("--from-snapshot", nargs="?", const="baseline", metavar="TAG", help="restore a provisioned snapshot instead")
+    s.add_argument("-y", "--yes", action="store_true", help="don't ask for confirmation")
+    s.add_argument("--no-cache", action="store_true", help="don't route apt/dnf through the host package cache")
+    b = sub.add_parser("bench"); b.add_argument("runs", nargs="*", help="two run timestamps (or prefixes) to compare, or 'failover'")
+    b.add_argument("-c", type=int, default=50, help="failover: keep-alive connections")
+    b.add_argument("--warmup", type=int, default=10, help="failover: seconds of load before standby")
+    b.add_argument("--duration", type=int, default=30, help="failover: seconds of load after standby")
+    cw = sub.add_parser("cluster"); cw.add_argument("action", choices=["watch"])
+    cw.add_argument("-f", "--follow", action="store_true", help="keep following after convergence (e.g. during a failover)")
+    cw.add_argument("--timeout", type=int, default=180)
+    sn = sub.add_parser("snapshot"); sn.add_argument("action", choices=["save", "restore", "list"]); sn.add_argument("tag", nargs="?", default="baseline")
+    c = sub.add_parser("cleanup"); c.add_argument("-y", "--yes", action="store_true", help="don't ask for confirmation")
+    f = sub.add_parser("fleet", help="several labs at once"); f.add_argument("action", choices=["list", "up", "down"])
+    f.add_argument("ids", nargs="*", help="instance numbers, e.g. 1 2 or 1-3")
+    f.add_argument("-j", type=int, default=2, help="phases run in parallel per lab")
+    sub.add_parser("stop"); sub.add_parser("check"); sub.add_parser("status")
+    sub.add_parser("info"); sub.add_parser("passwd")
+    l = sub.add_parser("logs"); l.add_argument("-n", type=int, default=50)
+    l.add_argument("-f", action="store_true", help="follow the log as it grows")
+    l.add_argument("-p", "--phase", help="only this phase's section")
+    l.add_argument("-t", "--run", help="run timestamp (or prefix), default latest")
+    l.add_argument("--markers", action="store_true", help="only START/OK/FAIL/SKIP lines")
+    l.add_argument("--fail", action="store_true", help="only failed phases")
+    l.add_argument("--list", action="store_true", help="list runs")
+    args = p.parse_args()
+    try: lab = Lab(args.instance)
+    except ValueError as e: print(f"{ERR} {e}"); sys.exit(2)
+    if not args.cmd: lab.menu()
+    elif args.cmd == "start": lab.workers = args.j; sys.exit(lab.start(args.v, args.resume, args.from_snapshot, args.yes, not args.no_cache) is False)
+    elif args.cmd == "stop": lab.stop()
+    elif args.cmd == "cleanup": sys.exit(lab.cleanup(args.yes) is False)
+    elif args.cmd == "fleet": lab.workers = args.j; sys.exit(lab.fleet(args.action, args.ids) is False)
+    elif args.cmd == "check": lab.check()
+    elif args.cmd == "status": lab.vm_status()
+    elif args.cmd == "info": lab.info()
+    elif args.cmd == "passwd": lab.creds()
+    elif args.cmd == "logs": lab.logs(args.n, args.f, args.phase, args.run, args.markers, args.fail, args.list)
+    elif args.cmd == "snapshot": lab.snapshot(args.action, args.tag)
+    elif args.cmd == "bench" and args.runs[:1] == ["failover"]: lab.failover(args.c, args.warmup, args.duration)
+    elif args.cmd == "bench": lab.bench(*args.runs[:2])
+    elif args.cmd == "cluster": sys.exit(lab.cluster_watch(args.timeout, args.follow) is False and not args.follow)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Cerberus - Package cache
+Caching HTTP proxy for apt/dnf, started by deploy.py on the host while the lab is provisioned so
+every Linux VM (and every later deploy) downloads each .deb/.rpm from the internet once.
+
+  python pkgcache.py serve [port]    run it standalone (e.g. shared by several `fleet up` labs)
+  python pkgcache.py stats           hit rates of the running cache and of everything stored
+  python pkgcache.py clear           drop everything stored
+
+Packages and hashed repository files never change under the same URL and are kept for good;
+repository indexes (InRelease, repomd.xml, ...) are reused for META_TTL seconds so VMs provisioned
+together share one download. HTTPS (CONNECT) is tunneled, not cached. Identical concurrent requests
+are coalesced: the first one downloads, the others wait and are served from disk.
+
+Only the lab VMs (and the host itself) are served, and only public mirrors are fetched from: this is
+not an open proxy for the LAN, nor a way into services listening on the host.
+"""
+import os, sys, re, json, time, socket, select, hashlib, threading, ipaddress, http.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".vagrant", "pkgcache")
+PORT = 3142
+META_TTL = 600
+# Never change once published: packages, apt by-hash files, rpm-md files named after their checksum
+IMMUTABLE = re.compile(r"(\.(deb|udeb|rpm|drpm)$)|(/by-hash/)|(/repodata/[0-9a-f]{32,}-[^/]+$)")
+METADATA = re.compile(r"/(InRelease|Release|Release\.gpg|Packages(\.\w+)?|Sources(\.\w+)?|Translation-\w+(\.\w+)?|repomd\.xml(\.asc)?)$")
+HOP = {"connection", "keep-alive", "proxy-connection", "proxy-authorization", "te", "trailers", "transfer-encoding", "upgrade"}
+# Clients: loopback and the host-only networks of the lab instances (192.168.56.x - 192.168.63.x)
+ALLOWED = [ipaddress.ip_network(n) for n in ("127.0.0.0/8", "192.168.56.0/21")]
+TUNNEL_PORTS = {443}
+CHUNK = 1 << 16
+
+class Cache:
+    """Files under ROOT named by sha256(url), with a .json sidecar (headers, size, time stored)."""
+    def __init__(self, root=ROOT):
+        self.root = root
+        self.locks, self.lock = {}, threading.Lock()
+        self.counts = {"hits": 0, "misses": 0, "bytes_hit": 0, "bytes_miss": 0, "passed": 0, "tunnels": 0, "errors": 0}
+        self.clients = {}
+
+    def path(self, url):
+        h = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.root, h[:2], h)
+
+    def url_lock(self, url):
+        with self.lock: return self.locks.setdefault(url, threading.Lock())
+
+    def lookup(self, url, ttl):
+        try:
+            with open(self.path(url) + ".json") as f: meta = json.load(f)
+        except (OSError, ValueError): return None
+        if ttl is not None and time.time() - meta["stored"] > ttl: return None
+        if not os.path.exists(self.path(url)): return None
+        return meta
+
+    def count(self, client, key, size=0):
+        """Totals, and the same counters per client address (a VM) so concurrent labs can be told apart."""
+        with self.lock:
+            for c in (self.counts, self.clients.setdefault(client, dict.fromkeys(self.counts, 0))):
+                c[key] += 1
+                if key in ("hits", "misses"): c["bytes_hit" if key == "hits" else "bytes_miss"] += size
+
+    def stats(self):
+        with self.lock:
+            out = dict(self.counts, clients={k: dict(v) for k, v in self.clients.items()})
+        out["stored"], out["stored_bytes"] = usage(self.root)
+        return out
+
+def usage(root=ROOT):
+    files = size = 0
+    for d, _, names in os.walk(root):
+        for n in names:
+            if not n.endswith(".json") and not n.endswith(".tmp"):
+                files += 1
+                size += os.path.getsize(os.path.join(d, n))
+    return files, size
+
+def allowed(client):
+    try: ip = ipaddress.ip_address(client)
+    except ValueError: return False
+    return any(ip in n for n in ALLOWED)
+
+def resolve(host, port):
+    """A public address of an upstream host, to connect to that address and not a second lookup.
+    Loopback, private and link-local targets (the host's own services, the LAN) are refused."""
+    for *_, addr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        if ipaddress.ip_address(addr[0].split("%")[0]).is_global: return addr[0]
+    raise PermissionError(f"{host}: not a public address")
+
+def policy(url):
+    """(cacheable, ttl): ttl None means keep forever."""
+    path = urlsplit(url).path
+    if IMMUTABLE.search(path): return True, None
+    if METADATA.search(path): return True, META_TTL
+    return False, 0
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    cache = None
+    def log_message(self, *a): pass
+
+    def handle(self):
+        if allowed(self.client_address[0]): super().handle()
+
+    def do_GET(self): self.proxy(head=False)
+    def do_HEAD(self): self.proxy(head=True)
+
+    def proxy(self, head):
+        url, client = self.path, self.client_address[0]
+        if url.startswith("/"):
+            return self.local(url)
+        cacheable, ttl = policy(url)
+        if not cacheable or head or "Range" in self.headers:
+            self.cache.count(client, "passed")
+            return self.forward(url, head)
+        meta = self.cache.lookup(url, ttl)
+        if not meta:
+            with self.cache.url_lock(url):
+                meta = self.cache.lookup(url, ttl)     # another VM may have just fetched it
+                if not meta: return self.fetch(url, client)
+        self.cache.count(client, "hits", meta["size"])
+        self.send_file(url, meta)
+
+    def local(self, path):
+        body = json.dumps(self.cache.stats()).encode() if path == "/_stats" else b""
+        self.send_response(200 if body else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def upstream(self, url, method="GET", skip=()):
+        u = urlsplit(url)
+        if u.scheme != "http" or not u.hostname: raise PermissionError(f"{url}: only http:// URLs are proxied")
+        conn = http.client.HTTPConnection(resolve(u.hostname, u.port or 80), u.port or 80, timeout=60)
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP | {"host", *skip}}
+        headers["Host"] = u.netloc
+        conn.request(method, (u.path or "/") + (f"?{u.query}" if u.query else ""), headers=headers)
+        return conn, conn.getresponse()
+
+    def send_head(self, status, headers, length):
+        self.send_response(status)
+        for k, v in headers:
+            if k.lower() not in HOP | {"content-length"}: self.send_header(k, v)
+        if length is None:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        else: self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+    def forward(self, url, head):
+        try: conn, r = self.upstream(url, "HEAD" if head else "GET")
+        except OSError as e: return self.fail(e)
+        try:
+            length = r.getheader("Content-Length")
+            self.send_head(r.status, r.getheaders(), int(length) if length else None if not head else 0)
+            if head: return
+            while True:
+                data = r.read(CHUNK)
+                if not data: break
+                self.wfile.write(data)
+        finally: conn.close()
+
+    def fetch(self, url, client):
+        """Miss: stream to the client while writing the cache file; only complete 200s are kept."""
+        # Unconditional, so what comes back is the whole file and can be stored
+        try: conn, r = self.upstream(url, skip=("if-modified-since", "if-none-match"))
+        except OSError as e: return self.fail(e)
+        try:
+            length = r.getheader("Content-Length")
+            self.send_head(r.status, r.getheaders(), int(length) if length else None)
+            path = self.cache.path(url)
+            out = None
+            if r.status == 200:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                out = open(path + ".tmp", "wb")
+            size, client_ok = 0, True
+            try:
+                while True:
+                    data = r.read(CHUNK)
+                    if not data: break
+                    size += len(data)
+                    if out: out.write(data)
+                    if client_ok:
+                        try: self.wfile.write(data)
+                        except OSError: client_ok = False   # keep filling the cache for the next VM
+            finally:
+                if out: out.close()
+            if out and (not length or size == int(length)):
+                os.replace(path + ".tmp", path)
+                keep = [(k, v) for k, v in r.getheaders() if k.lower() in ("content-type", "last-modified", "etag")]
+                with open(path + ".json", "w") as f: json.dump({"url": url, "size": size, "stored": time.time(), "headers": keep}, f)
+            elif out: os.remove(path + ".tmp")
+            self.cache.count(client, "misses" if r.status == 200 else "passed", size)
+            if not client_ok: self.close_connection = True
+        finally: conn.close()
+
+    def send_file(self, url, meta):
+        self.send_head(200, meta["headers"], meta["size"])
+        with open(self.cache.path(url), "rb") as f:
+            while True:
+                data = f.read(CHUNK)
+                if not data: break
+                self.wfile.write(data)
+
+    def fail(self, e):
+        self.cache.count(self.client_address[0], "errors")
+        body = f"pkgcache: {e}\n".encode()
+        self.send_response(403 if isinstance(e, PermissionError) else 502)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_CONNECT(self):
+        """HTTPS: plain tunnel to port 443 of a public host, counted but not cached."""
+        host, _, port = self.path.rpartition(":")
+        try:
+            port = int(port or 443)
+            if port not in TUNNEL_PORTS: raise PermissionError(f"CONNECT to port {port} refused")
+            upstream = socket.create_connection((resolve(host.strip("[]"), port), port), timeout=30)
+        except (OSError, ValueError) as e: return self.fail(e)
+        self.cache.count(self.client_address[0], "tunnels")
+        self.send_response(200, "Connection established")
+        self.end_headers()
+        self.close_connection = True
+        socks = [self.connection, upstream]
+        try:
+            while True:
+                ready, _, _ = select.select(socks, [], [], 300)
+                if not ready: break
+                for s in ready:
+                    data = s.recv(CHUNK)
+                    if not data: return
+                    (upstream if s is self.connection else self.connection).sendall(data)
+        except OSError: pass
+        finally: upstream.close()
+
+class PackageCache:
+    """The proxy on 0.0.0.0:PORT (the host-only adapters may not exist before the first VM boots); only
+    ALLOWED clients get an answer. If another deploy.py already runs one on that port, this attaches
+    to it instead and reads its stats over /_stats."""
+    def __init__(self, port=PORT, root=ROOT):
+        self.port, self.root, self.http, self.cache = port, root, None, None
+
+    def start(self):
+        try:
+            self.cache = Cache(self.root)
+            handler = type("Handler", (Handler,), {"cache": self.cache})
+            self.http = ThreadingHTTPServer(("0.0.0.0", self.port), handler)
+        except OSError:
+            self.cache = None
+            if self.remote_stats() is None: raise
+            return self
+        self.http.daemon_threads = True
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def shared(self):
+        return self.http is None
+
+    def remote_stats(self):
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=2)
+            conn.request("GET", "/_stats")
+            r = conn.getresponse()
+            return json.loads(r.read()) if r.status == 200 else None
+        except (OSError, ValueError): return None
+
+    def stats(self):
+        return self.cache.stats() if self.cache else self.remote_stats() or {}
+
+    def close(self):
+        if self.http: self.http.shutdown(); self.http.server_close()
+
+def report(before, after):
+    """Hit rate between two stats() snapshots, e.g. '312 requests, 86% from cache (1.1 GB local, 160 MB downloaded), 24 via HTTPS'."""
+    d = {k: after.get(k, 0) - before.get(k, 0) for k in ("hits", "misses", "bytes_hit", "bytes_miss", "passed", "tunnels", "errors")}
+    n = d["hits"] + d["misses"]
+    if not n and not d["tunnels"] and not d["passed"]: return None
+    rate = f"{100 * d['hits'] / n:.0f}%" if n else "-"
+    mb = lambda b: f"{b / 2**30:.1f} GB" if b >= 2**30 else f"{b / 2**20:.0f} MB"
+    out = f"{n} cacheable requests, {rate} from cache ({mb(d['bytes_hit'])} local, {mb(d['bytes_miss'])} downloaded)"
+    if d["passed"]: out += f", {d['passed']} passed through"
+    if d["tunnels"]: out += f", {d['tunnels']} via HTTPS (not cached)"
+    if d["errors"]: out += f", {d['errors']} upstream errors"
+    return out
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["serve"]:
+        pc = PackageCache(int(sys.argv[2]) if sys.argv[2:] else PORT).start()
+        if pc.shared: sys.exit(f"pkgcache: another cache is already serving port {pc.port}")
+        print(f"Package cache on :{pc.port}, stored in {pc.root} (Ctrl+C to stop)")
+        try:
+            while True:
+                before = pc.stats()
+                time.sleep(30)
+                line = report(before, pc.stats())
+                if line: print(f"[{time.strftime('%H:%M:%S')}] {line}")
+        except KeyboardInterrupt: pc.close()
+    elif sys.argv[1:2] == ["stats"]:
+        live = PackageCache().remote_stats()
+        if live: print(f"running: {report({}, live)}")
+        files, size = usage()
+        print(f"stored:  {files} files, {size / 2**20:.0f} MB in {ROOT}")
+    elif sys.argv[1:2] == ["clear"]:
+        import shutil
+        shutil.rmtree(ROOT, ignore_errors=True)
+        print(f"Cleared {ROOT}")
+    else:
+        print(__doc__)
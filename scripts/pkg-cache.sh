@@ -0,0 +1,58 @@
+#!/bin/bash
+# Point apt/dnf at the package cache deploy.py runs on the host (pkgcache.py), or undo it.
+#   pkg-cache.sh on http://192.168.56.1:3142     (Vagrant provisioner, before anything is installed)
+#   cerberus-pkg-cache off                       (deploy.py, once provisioning is done)
+# "on" does nothing if the cache can't be reached, so provisioning never depends on it.
+set -u
+ACTION=${1:-}
+PROXY=${2:-}
+SELF=/usr/local/sbin/cerberus-pkg-cache
+APT_CONF=/etc/apt/apt.conf.d/01cerberus-pkg-cache
+BACKUP=/etc/yum.repos.d/.cerberus-pkg-cache
+
+reachable() {
+  local hostport=${1#http://}
+  hostport=${hostport%/}
+  timeout 3 bash -c "</dev/tcp/${hostport%:*}/${hostport##*:}" 2>/dev/null
+}
+
+case "$ACTION" in
+on)
+  if ! reachable "$PROXY"; then
+    echo "pkg-cache: $PROXY not reachable, downloading directly"
+    exit 0
+  fi
+  install -m 755 "$0" "$SELF"
+  if command -v apt-get >/dev/null; then
+    printf 'Acquire::http::Proxy "%s";\nAcquire::https::Proxy "%s";\n' "$PROXY" "$PROXY" > "$APT_CONF"
+  fi
+  if command -v dnf >/dev/null; then
+    # One fixed http mirror instead of a random https one from the mirrorlist, so every node hits the same cached URLs
+    mkdir -p "$BACKUP"
+    for repo in /etc/yum.repos.d/*.repo; do
+      grep -q '^#baseurl=http://dl.rockylinux.org' "$repo" || continue
+      cp -n "$repo" "$BACKUP/"
+      sed -i -e 's/^mirrorlist=/#mirrorlist=/' -e 's|^#baseurl=http://dl.rockylinux.org|baseurl=http://dl.rockylinux.org|' "$repo"
+    done
+    sed -i '/^proxy=/d' /etc/dnf/dnf.conf
+    sed -i "/^\[main\]/a proxy=$PROXY" /etc/dnf/dnf.conf
+  fi
+  echo "pkg-cache: using $PROXY"
+  ;;
+off)
+  rm -f "$APT_CONF"
+  if [ -f /etc/dnf/dnf.conf ]; then
+    sed -i '/^proxy=/d' /etc/dnf/dnf.conf
+    if [ -d "$BACKUP" ]; then
+      cp "$BACKUP"/*.repo /etc/yum.repos.d/ 2>/dev/null
+      rm -rf "$BACKUP"
+    fi
+  fi
+  rm -f "$SELF"
+  echo "pkg-cache: off"
+  ;;
+*)
+  echo "usage: $0 on <proxy url> | off" >&2
+  exit 2
+  ;;
+esac
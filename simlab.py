@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Cerberus - Simulated lab backend
+Stands in for vagrant, the VMs and the Zabbix API so deploy.py runs on a plain box in seconds
+(PROVIDER=sim in .cerberus_config, or `provider` in the menu).
+
+  python simlab.py vagrant <args>    fake vagrant CLI: replays a recorded install log
+  python simlab.py serve             ssh/winrm/Zabbix/VIP stand-ins on localhost
+
+Tuning (environment):
+  CERBERUS_SIM_LOG       recorded run to replay (default: latest logs/install_*.txt with an Ansible section)
+  CERBERUS_SIM_SPEED     replay speed-up, default 60 (a 20 min deploy takes ~20 s)
+  CERBERUS_SIM_LATENCY   seconds added to every fake command, default 0.2
+  CERBERUS_SIM_FAIL      phases to fail, "Ansible Windows" or "Ansible Linux:0.3,Dashboard" (name[:probability])
+  CERBERUS_SIM_OUTAGE    seconds the VIP answers 503 after a standby, default 3
+  CERBERUS_SIM_DIR       state directory (set by deploy.py per lab instance)
+"""
+import os, sys, re, glob, json, time, math, random, socket, threading, contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".vagrant", "sim")
+DIR = os.environ.get("CERBERUS_SIM_DIR", ROOT)      # one per lab instance
+STATE = os.path.join(DIR, "state.json")
+VMS = ("admin", "node01", "node02", "winsrv")
+MARKER = re.compile(r"^\[(\d\d):(\d\d):(\d\d)\] (START|OK|FAIL): (.+?)(?: \(.*\))?$")
+
+def env(name, default):
+    return type(default)(os.environ.get(f"CERBERUS_SIM_{name}", default))
+
+# ---------------------------------------------------------------- state
+
+@contextlib.contextmanager
+def locked():
+    """Fake commands run concurrently (Linux and Windows lanes): serialise read-modify-write of the state."""
+    os.makedirs(DIR, exist_ok=True)
+    with open(STATE + ".lock", "w") as lock:
+        try:
+            import fcntl
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        except ImportError: pass
+        st = load()
+        yield st
+        with open(STATE + ".tmp", "w") as f: json.dump(st, f, indent=1)
+        os.replace(STATE + ".tmp", STATE)
+
+def load(path=None):
+    try:
+        with open(path or STATE) as f: return json.load(f)
+    except (OSError, ValueError):
+        return {"vms": {vm: "not_created" for vm in VMS}, "provisioned": False, "snapshots": {}, "vip": "node01", "moving_until": 0}
+
+# ---------------------------------------------------------------- replay
+
+def recording():
+    path = os.environ.get("CERBERUS_SIM_LOG")
+    if path: return path
+    for path in sorted(glob.glob("logs/install_*.txt"), reverse=True):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            if "START: Ansible Linux" in f.read(): return path
+    raise SystemExit("simlab: no recorded run to replay (set CERBERUS_SIM_LOG)")
+
+def sections(path):
+    """{phase: (seconds, lines)} from the START/OK markers of a recorded run."""
+    out, cur = {}, None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = MARKER.match(line)
+            if not m:
+                if cur: cur[2].append(line)
+                continue
+            secs = int(m.group(1))*3600 + int(m.group(2))*60 + int(m.group(3))
+            if m.group(4) == "START": cur = (m.group(5), secs, [])
+            elif cur and cur[0] == m.group(5):
+                out[cur[0]] = ((secs - cur[1]) % 86400, cur[2])
+                cur = None
+    return out
+
+def should_fail(phase):
+    for spec in filter(None, os.environ.get("CERBERUS_SIM_FAIL", "").split(",")):
+        name, _, p = spec.partition(":")
+        if name.strip().lower() in phase.lower() and random.random() < float(p or 1): return True
+    return False
+
+def replay(phase):
+    """Print the phase's recorded output spread over its recorded duration / speed. Returns the exit code."""
+    secs, lines = sections(recording()).get(phase, (0, []))
+    fail = should_fail(phase)
+    if fail: lines = lines[:len(lines)//2]
+    step = secs / env("SPEED", 60.0) / max(1, len(lines))
+    t0 = time.time()
+    for i, line in enumerate(lines):
+        sys.stdout.write(line)
+        ahead = t0 + (i + 1)*step - time.time()
+        if ahead > 0.02:
+            sys.stdout.flush()
+            time.sleep(ahead)
+    if fail: print(f'fatal: [sim]: FAILED! => {{"msg": "simulated failure in {phase}"}}')
+    sys.stdout.flush()
+    return 2 if fail else 0
+
+# ---------------------------------------------------------------- fake cluster
+
+RESOURCES = ("cluster-vip", "webserver", "samba")
+
+def crm_mon(end):
+    """The `while :; do crm_mon ...; echo END; sleep 1; done` loop: resources start one after another
+    after provisioning or a standby, then stay on the node holding the VIP."""
+    try:
+        while True:
+            st, now = load(), time.time()
+            if not st["provisioned"]: print("crm_mon: Error: cluster is not available on this node")
+            else:
+                since = max(st.get("provisioned_at", 0), st["moving_until"])
+                nodes = "".join(f'<node name="{n}" online="{str(st["vms"][n] == "running").lower()}" standby="false"/>' for n in ("node01", "node02"))
+                res = "".join(f'<resource id="{r}" role="Started" active="true" failed="false"><node name="{st["vip"]}"/></resource>'
+                              if now >= since + 0.5 * (i + 1) else f'<resource id="{r}" role="Stopped" active="false" failed="false"/>'
+                              for i, r in enumerate(RESOURCES))
+                print(f'<pacemaker-result><nodes>{nodes}</nodes><resources><group id="ha-services">{res}</group></resources></pacemaker-result>')
+            print(end, flush=True)
+            time.sleep(0.25)
+    except (BrokenPipeError, KeyboardInterrupt): return 0
+
+# ---------------------------------------------------------------- fake vagrant
+
+def ssh(vm, cmd):
+    if not cmd:
+        print(f"simlab: {vm} is simulated, there is no shell"); return 1
+    if load()["vms"].get(vm) != "running":
+        print(f"simlab: {vm} is not running"); return 1
+    if "crm_mon" in cmd: return crm_mon(re.search(r"echo (\S+);", cmd).group(1))
+    if "crm_resource" in cmd and "--locate" in cmd:
+        print(f"resource cluster-vip is running on: {load()['vip']}"); return 0
+    m = re.search(r"pcs node standby (\S+)", cmd)
+    if m:
+        with locked() as st:
+            if st["vip"] == m.group(1): st["vip"] = "node02" if st["vip"] == "node01" else "node01"
+            st["moving_until"] = time.time() + env("OUTAGE", 3.0)
+        return 0
+    if "create-dashboard" in cmd: return replay("Dashboard")
+    if "ansible-playbook" in cmd:
+        if "--limit winsrv" in cmd: return replay("Ansible Windows")
+        rc = replay("Ansible Linux")
+        if rc == 0:
+            with locked() as st: st["provisioned"], st["provisioned_at"] = True, time.time()
+        return rc
+    return 0
+
+def vagrant(args):
+    time.sleep(env("LATENCY", 0.2))
+    args = [a for a in args if not a.startswith("--provider")]
+    cmd, rest = (args[0], args[1:]) if args else ("", [])
+    vms = [a for a in rest if a in VMS] or list(VMS)
+    if cmd == "up":
+        rc = replay("Windows VM" if vms == ["winsrv"] else "Linux VMs")
+        if rc == 0:
+            with locked() as st: st["vms"].update({vm: "running" for vm in vms})
+        return rc
+    if cmd == "status":
+        st, now = load(), int(time.time())
+        if "--machine-readable" in rest:
+            for vm in vms:
+                print(f"{now},{vm},provider-name,sim")
+                print(f"{now},{vm},state,{st['vms'][vm]}")
+        else:
+            print("Current machine states:\n")
+            for vm in vms: print(f"{vm:<25} {st['vms'][vm].replace('_', ' ')} (sim)")
+        return 0
+    if cmd == "ssh":
+        cmd_arg = rest[rest.index("-c") + 1] if "-c" in rest else None
+        return ssh(vms[0], cmd_arg)
+    if cmd == "halt":
+        with locked() as st: st["vms"].update({vm: "poweroff" for vm in vms if st["vms"][vm] == "running"})
+        return 0
+    if cmd == "destroy":
+        with locked() as st:
+            st["vms"].update({vm: "not_created" for vm in vms})
+            st["provisioned"], st["snapshots"] = False, {}
+        return 0
+    if cmd == "snapshot" and len(rest) >= 3:
+        action, vm, tag = rest[:3]
+        with locked() as st:
+            if action == "save":
+                if st["vms"][vm] == "not_created": print(f"simlab: {vm} not created"); return 1
+                st["snapshots"].setdefault(tag, {})[vm] = {"provisioned": st["provisioned"]}
+            elif action == "restore":
+                snap = st["snapshots"].get(tag, {}).get(vm)
+                if not snap: print(f"simlab: no snapshot '{tag}' for {vm}"); return 1
+                st["vms"][vm], st["provisioned"] = "running", snap["provisioned"]
+        return 0
+    print(f"simlab: unsupported vagrant command: {' '.join(args)}")
+    return 1
+
+# ---------------------------------------------------------------- endpoints
+
+class FakeZabbix:
+    """In-memory Zabbix JSON-RPC: enough of host/item/graph/dashboard/history for the lab tooling."""
+    def __init__(self, agents=("node01", "node02")):
+        self.lock = threading.Lock()
+        self.ids = iter(range(10001, 10**9))
+        self.groups = {"Linux servers": "2"}
+        self.templates = {"Linux by Zabbix agent": "10001"}
+        self.hosts, self.dashboards = {}, {}
+        for h in agents: self.add_host({"host": h})
+
+    def add_host(self, h):
+        hid = str(next(self.ids))
+        self.hosts[hid] = {"hostid": hid, "host": h["host"], "interfaces": [], "groups": h.get("groups", []), "templates": h.get("templates", [])}
+        for i in h.get("interfaces", []): self.add_interface(dict(i, hostid=hid))
+        return hid
+
+    def add_interface(self, i):
+        i = {k: str(v) for k, v in i.items()}
+        i["interfaceid"] = str(next(self.ids))
+        self.hosts[i["hostid"]]["interfaces"].append(i)
+        return i["interfaceid"]
+
+    def host_out(self, h, p):
+        out = dict(h)
+        if "selectHostGroups" in p: out["hostgroups"] = h["groups"]
+        if "selectParentTemplates" in p: out["parentTemplates"] = h["templates"]
+        return out
+
+    def items(self, hostids=None):
+        return [{"itemid": f"{hid}{k}", "hostid": hid, "key_": key, "name": name, "value_type": "0"}
+                for hid in sorted(self.hosts) if not hostids or hid in hostids
+                for k, (key, name) in enumerate([("system.cpu.util", "CPU utilization"), ("vm.memory.utilization", "Memory utilization")])]
+
+    def history(self, p):
+        """Synthetic minute samples: a daily sine plus noise per item."""
+        a, b = int(p.get("time_from", time.time() - 3600)), int(p.get("time_till", time.time()))
+        rows = []
+        for iid in p.get("itemids", []):
+            rnd = random.Random(iid)
+            for c in range((a + 59)//60*60, b + 1, 60):
+                v = 40 + 30*math.sin(c / 86400 * 2*math.pi + int(iid) % 7) + rnd.uniform(-5, 5)
+                rows.append({"itemid": iid, "clock": str(c), "value": f"{v:.4f}", "value_avg": f"{v:.4f}",
+                             "value_min": f"{v-5:.4f}", "value_max": f"{v+5:.4f}"})
+        rows.sort(key=lambda r: int(r["clock"]))
+        return rows[:int(p.get("limit", len(rows) or 1))]
+
+    def call(self, method, p):
+        with self.lock:
+            if method == "apiinfo.version": return "7.0.0"
+            if method == "user.login": return "sim-token"
+            if method == "hostgroup.get": return [{"groupid": g, "name": n} for n, g in self.groups.items()]
+            if method == "template.get": return [{"templateid": t, "host": n, "name": n} for n, t in self.templates.items()]
+            if method == "host.get":
+                names = (p.get("filter") or {}).get("host")
+                names = [names] if isinstance(names, str) else names
+                return [self.host_out(h, p) for h in self.hosts.values() if not names or h["host"] in names]
+            if method == "host.create":
+                return {"hostids": [self.add_host(h) for h in (p if isinstance(p, list) else [p])]}
+            if method == "host.update":
+                hosts = p if isinstance(p, list) else [p]
+                for h in hosts: self.hosts[h["hostid"]].update({k: v for k, v in h.items() if k != "hostid"})
+                return {"hostids": [h["hostid"] for h in hosts]}
+            if method == "host.massadd":
+                for h in p["hosts"]:
+                    cur = self.hosts[h["hostid"]]
+                    for k in ("groups", "templates", "interfaces"): cur[k] = cur[k] + [x for x in p.get(k, []) if x not in cur[k]]
+                return {"hostids": [h["hostid"] for h in p["hosts"]]}
+            if method == "hostinterface.create":
+                return {"interfaceids": [self.add_interface(i) for i in (p if isinstance(p, list) else [p])]}
+            if method == "hostinterface.update":
+                ifs = {i["interfaceid"]: i for h in self.hosts.values() for i in h["interfaces"]}
+                for i in (p if isinstance(p, list) else [p]): ifs[i["interfaceid"]].update({k: str(v) for k, v in i.items()})
+                return {"interfaceids": [i["interfaceid"] for i in (p if isinstance(p, list) else [p])]}
+            if method == "item.get": return self.items(p.get("hostids"))
+            if method == "graph.get":
+                return [{"graphid": f"2{i['itemid']}", "name": f"Linux: {i['name']}",
+                         "hosts": [{"hostid": i["hostid"], "host": self.hosts[i["hostid"]]["host"]}]} for i in self.items()]
+            if method in ("history.get", "trend.get"): return self.history(p)
+            if method == "dashboard.get":
+                ids, name = p.get("dashboardids"), (p.get("filter") or {}).get("name")
+                return [dict(d) for d in self.dashboards.values() if (not ids or d["dashboardid"] in ids) and (not name or d["name"] == name)]
+            if method == "dashboard.create":
+                did = str(next(self.ids))
+                self.dashboards[did] = dict(p, dashboardid=did)
+                return {"dashboardids": [did]}
+            if method == "dashboard.update":
+                self.dashboards[p["dashboardid"]].update(p)
+                return {"dashboardids": [p["dashboardid"]]}
+            raise KeyError(method)
+
+class Endpoints:
+    """Local stand-ins for what deploy.py probes: one TCP listener for ssh, one HTTP server for
+    WinRM (/wsman), the Zabbix API (/api_jsonrpc.php) and the VIP (/). Answers follow the fake VM state."""
+    def __init__(self, host="127.0.0.1", gated=True, dir=DIR):
+        self.host, self.gated, self.zabbix = host, gated, FakeZabbix()
+        self.path = os.path.join(dir, "state.json")
+        self._state, self._mtime = load(self.path), 0
+
+    def state(self):
+        try: m = os.stat(self.path).st_mtime
+        except OSError: m = 0
+        if m != self._mtime: self._state, self._mtime = load(self.path), m
+        return self._state
+
+    def start(self):
+        self.ssh = socket.create_server((self.host, 0))
+        threading.Thread(target=self._accept, daemon=True).start()
+        lab = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            def log_message(self, *a): pass
+            def reply(self, code, body=b""):
+                self.send_response(code)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def do_GET(self): self.reply(*lab.route(self.path, None))
+            def do_POST(self): self.reply(*lab.route(self.path, self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+        self.http = ThreadingHTTPServer((self.host, 0), Handler)
+        self.http.daemon_threads = True
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        return self
+
+    def _accept(self):
+        while True:
+            try: self.ssh.accept()[0].close()
+            except OSError: return
+
+    def route(self, path, body):
+        st = self.state() if self.gated else dict(load(self.path), vms={vm: "running" for vm in VMS}, provisioned=True)
+        up = lambda vm: st["vms"].get(vm) == "running"
+        if path.startswith("/wsman"): return (405, b"") if up("winsrv") else (503, b"")
+        if path.startswith("/api_jsonrpc.php"):
+            if not (up("admin") and st["provisioned"]): return 503, b""
+            return 200, json.dumps(self.rpc(json.loads(body or b"{}"))).encode()
+        if not (up("node01") or up("node02")) or not st["provisioned"] or time.time() < st["moving_until"]: return 503, b""
+        return 200, f"CERBERUS - {st['vip']}\n".encode()
+
+    def rpc(self, req):
+        if isinstance(req, list): return [self.rpc(r) for r in req]
+        try: return {"jsonrpc": "2.0", "result": self.zabbix.call(req.get("method"), req.get("params") or {}), "id": req.get("id")}
+        except KeyError as e: return {"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found.", "data": str(e)}, "id": req.get("id")}
+
+    @property
+    def endpoints(self):
+        ssh, http = self.ssh.getsockname()[1], self.http.server_address[1]
+        return {"ssh:admin": (self.host, ssh), "ssh:node01": (self.host, ssh), "ssh:node02": (self.host, ssh),
+                "winrm:winsrv": (self.host, http), "zabbix-api": (self.host, http), "vip": (self.host, http)}
+
+    def close(self):
+        self.http.shutdown()
+        self.ssh.close()
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["vagrant"]:
+        sys.exit(vagrant(sys.argv[2:]))
+    elif sys.argv[1:2] == ["serve"]:
+        ep = Endpoints(gated=False).start()
+        for name, (h, p) in ep.endpoints.items(): print(f"{name:<14} {h}:{p}")
+        print(f"\nZabbix API: http://{ep.host}:{ep.http.server_address[1]}/api_jsonrpc.php (Ctrl+C to stop)")
+        try: threading.Event().wait()
+        except KeyboardInterrupt: ep.close()
+    else:
+        print(__doc__)